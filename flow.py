@@ -14,10 +14,12 @@ def create_tutorial_flow():
 
     # Instantiate nodes
     fetch_repo = FetchRepo()
-    identify_abstractions = IdentifyAbstractions(max_retries=5, wait=20)
-    analyze_relationships = AnalyzeRelationships(max_retries=5, wait=20)
-    order_chapters = OrderChapters(max_retries=5, wait=20)
-    write_chapters = WriteChapters(max_retries=5, wait=20) # This is a BatchNode
+    # API errors are retried with backoff inside call_llm (per-node policies in utils/llm_retry.py);
+    # node retries only re-ask the LLM, bypassing the cache, when its output fails validation
+    identify_abstractions = IdentifyAbstractions(max_retries=3)
+    analyze_relationships = AnalyzeRelationships(max_retries=3)
+    order_chapters = OrderChapters(max_retries=3)
+    write_chapters = WriteChapters(max_retries=2) # This is a BatchNode
     combine_tutorial = CombineTutorial()
 
     # Connect nodes in sequence based on the design
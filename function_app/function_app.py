@@ -77,6 +77,33 @@ def save_error_log(error_message: str):
     except Exception as e:
         print(f"Failed to save error log: {e}")
 
+# Cache pack ("container/blob", exported with `python utils/llm_cache.py export`) used to
+# pre-warm the LLM cache of each new worker before it processes jobs
+LLM_CACHE_PACK_BLOB = os.getenv("LLM_CACHE_PACK_BLOB")
+_llm_cache_warmed = False
+
+def warm_llm_cache():
+    """Download the LLM cache pack from blob storage and merge it into this worker's cache (once per process)"""
+    global _llm_cache_warmed
+    if _llm_cache_warmed or not LLM_CACHE_PACK_BLOB:
+        return
+    _llm_cache_warmed = True
+    try:
+        from utils.call_llm import cache_file
+        from utils.llm_cache import get_cache
+
+        container_name, _, blob_name = LLM_CACHE_PACK_BLOB.partition("/")
+        blob_service_client = BlobServiceClient.from_connection_string(os.environ.get("AzureWebJobsStorage"))
+        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+        pack_path = os.path.join("/tmp", os.path.basename(blob_name))
+        with open(pack_path, "wb") as f:
+            blob_client.download_blob().readinto(f)
+        added, skipped = get_cache(cache_file).import_pack(pack_path)
+        logging.info(f"Warmed LLM cache from {LLM_CACHE_PACK_BLOB}: {added} added, {skipped} already present")
+    except Exception as e:
+        # A cold cache only costs extra LLM calls, never fail the job for it
+        logging.warning(f"Failed to warm LLM cache from {LLM_CACHE_PACK_BLOB}: {e}")
+
 @app.function_name(name="generate")
 @app.queue_trigger(arg_name="msg", queue_name="jobsqueue", connection="AzureWebJobsStorage")
 def generate(msg: func.QueueMessage) -> None:
@@ -92,6 +119,7 @@ def generate(msg: func.QueueMessage) -> None:
     try:
         from main import generate_tutorial_content
         logging.info("Successfully imported project modules")
+        warm_llm_cache()
     except Exception as e:
         error_message = f"Failed to import project modules: {str(e)}"
         save_error_log(error_message)
@@ -3,6 +3,8 @@ import os
 import argparse
 # Import the function that creates the flow
 from flow import create_tutorial_flow
+from nodes import upload_to_blob_storage
+from utils.llm_metrics import metrics
 
 dotenv.load_dotenv()
 
@@ -20,7 +22,7 @@ DEFAULT_EXCLUDE_PATTERNS = {
 }
 
 # New function for Azure Functions integration
-def generate_tutorial_content(repo_url, repo_name, include_patterns=None, exclude_patterns=None, max_file_size=100000, language="english"):
+def generate_tutorial_content(repo_url, repo_name, include_patterns=None, exclude_patterns=None, max_file_size=100000, language="english", stream_chapters=True):
     """
     Generate tutorial content for the given repository.
     This function is called directly by the Azure Function instead of via subprocess.
@@ -32,6 +34,7 @@ def generate_tutorial_content(repo_url, repo_name, include_patterns=None, exclud
         exclude_patterns: List of file patterns to exclude
         max_file_size: Maximum file size in bytes
         language: Language for the tutorial
+        stream_chapters: Stream chapter content into blob storage as it is generated
         
     Returns:
         A dictionary with the generation results
@@ -55,6 +58,9 @@ def generate_tutorial_content(repo_url, repo_name, include_patterns=None, exclud
         # Add language for multi-language support
         "language": language,
         
+        # Stream chapter content into blob storage as the LLM generates it
+        "stream_chapters": stream_chapters,
+        
         # Outputs will be populated by the nodes
         "files": [],
         "abstractions": [],
@@ -70,8 +76,21 @@ def generate_tutorial_content(repo_url, repo_name, include_patterns=None, exclud
     # Create the flow instance
     tutorial_flow = create_tutorial_flow()
     
+    # The worker process is reused across jobs, so only report this job's metrics
+    metrics.reset()
+    
     # Run the flow
     tutorial_flow.run(shared)
+
+    # Show per-stage LLM latency, tokens and cost; keep the metrics of every job in blob storage
+    # (container "llm-metrics") so p50/p95 per stage can be tracked across production jobs
+    print(metrics.format_report())
+    try:
+        json_path, _ = metrics.write(name=repo_name)
+        with open(json_path, "r", encoding="utf-8") as f:
+            upload_to_blob_storage("llm-metrics", f"{repo_name}/{os.path.basename(json_path)}", f.read(), "application/json")
+    except Exception as e:
+        print(f"Failed to save LLM metrics: {e}")
     
     # Return the results
     return {
@@ -99,6 +118,7 @@ def main():
     parser.add_argument("-s", "--max-size", type=int, default=100000, help="Maximum file size in bytes (default: 100000, about 100KB).")
     # Add language parameter for multi-language support
     parser.add_argument("--language", default="english", help="Language for the generated tutorial (default: english)")
+    parser.add_argument("--no-stream", action="store_true", help="Write chapter files only at the end instead of streaming them as they are generated.")
 
     args = parser.parse_args()
 
@@ -125,6 +145,9 @@ def main():
         # Add language for multi-language support
         "language": args.language,
 
+        # Stream chapter content into the output files as the LLM generates it
+        "stream_chapters": not args.no_stream,
+
         # Outputs will be populated by the nodes
         "files": [],
         "abstractions": [],
@@ -143,5 +166,10 @@ def main():
     # Run the flow
     tutorial_flow.run(shared)
 
+    # Show per-stage LLM latency, tokens and cost, and dump the metrics (JSON + Prometheus text)
+    print(metrics.format_report())
+    json_path, prom_path = metrics.write(name=shared["project_name"])
+    print(f"LLM metrics written to {json_path} and {prom_path}")
+
 if __name__ == "__main__":
     main()
@@ -1,51 +1,242 @@
-from google import genai
 import os
-import logging
-import json
-from datetime import datetime
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+import weakref
+try:
+    from utils.llm_cache import get_cache, prompt_key, DEFAULT_LEASE_TTL
+    from utils.llm_client import get_client, get_async_client
+    from utils.rate_limiter import get_rate_limiter, estimate_tokens
+    from utils.llm_routing import get_route, route_namespace
+    from utils.llm_cassette import get_cassette
+    from utils.llm_logging import setup_llm_logger, log_prompt, log_response
+    from utils.single_flight import SingleFlight, AsyncSingleFlight
+    from utils.llm_retry import get_retry_policy, call_with_retry, acall_with_retry, classify_error
+    from utils.llm_metrics import metrics
+    from utils.llm_hedging import hedger
+    from utils.llm_batch import get_batcher, batch_mode_enabled
+except ImportError:  # Running this file directly (python utils/call_llm.py)
+    from llm_cache import get_cache, prompt_key, DEFAULT_LEASE_TTL
+    from llm_client import get_client, get_async_client
+    from rate_limiter import get_rate_limiter, estimate_tokens
+    from llm_routing import get_route, route_namespace
+    from llm_cassette import get_cassette
+    from llm_logging import setup_llm_logger, log_prompt, log_response
+    from single_flight import SingleFlight, AsyncSingleFlight
+    from llm_retry import get_retry_policy, call_with_retry, acall_with_retry, classify_error
+    from llm_metrics import metrics
+    from llm_hedging import hedger
+    from llm_batch import get_batcher, batch_mode_enabled
 
-# Configure logging
+# Configure logging: records are written by a background thread to a rotated, compressed log
+# (see utils/llm_logging.py; LLM_LOG_MODE=full also logs complete prompts and responses)
 log_directory = os.getenv("LOG_DIR", "/tmp/logs")
-os.makedirs(log_directory, exist_ok=True)
-log_file = os.path.join(log_directory, f"llm_calls_{datetime.now().strftime('%Y%m%d')}.log")
-
-# Set up logger
-logger = logging.getLogger("llm_logger")
-logger.setLevel(logging.INFO)
-logger.propagate = False  # Prevent propagation to root logger
-file_handler = logging.FileHandler(log_file)
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-
-# Simple cache configuration
-cache_file = "llm_cache.json"
-
-# By default, we Google Gemini 2.5 pro, as it shows great performance for code understanding
-def call_llm(prompt: str, use_cache: bool = True) -> str:
+logger = setup_llm_logger(log_directory)
+
+# Cache configuration: responses are stored in a SQLite database (see utils/llm_cache.py).
+# Import an existing llm_cache.json once with: python utils/llm_cache.py import llm_cache.json
+cache_file = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+
+# Maximum number of in-flight acall_llm requests per event loop
+max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+_semaphores = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+# Identical prompts in flight at the same time share one API call: within this process through
+# these registries, across processes through a claim (lease) in the cache database
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+# A claim expires after LLM_INFLIGHT_TTL so a crashed process does not block others for long;
+# while the call that holds it is still running (a batch job can take hours), it is renewed
+_claim_renewals = {}  # prompt key -> threading.Event that stops the renewal
+
+# Project (repository) the current run is generating for; cache entries are tagged with it
+# so cache packs can be exported per project (see utils/llm_cache.py)
+current_project = contextvars.ContextVar("llm_project", default="")
+
+def _resolve_route(stage: str = None):
+    """Look up the model route for a stage (see utils/llm_routing.py) and its shared client"""
+    route = get_route(stage)
+    if route["provider"] != "gemini":
+        raise ValueError(f"Unsupported provider '{route['provider']}' for stage {stage}: call_llm only implements gemini")
+    # Client using direct API key instead of Vertex AI, reused across calls (see utils/llm_client.py)
+    client = get_client(route["provider"], api_key=os.getenv("GEMINI_API_KEY", "your-api-key"), model=route["model"])
+    return route, client
+
+def _finish_call(stage: str, route: dict, prompt: str, response_text: str, started: float, source: str,
+                 response=None, retries: int = 0):
+    """
+    Record metrics for a completed call and log it (source: "api", "batch", "cache", "dedup" or "replay").
+    Token counts come from the response's usage metadata, or are estimated from the text.
+    """
+    seconds = time.perf_counter() - started
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+    response_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(response_text or "")
+    metrics.record(stage, route["model"], source, seconds, prompt_tokens, response_tokens, retries)
+    log_response(logger, stage, route["model"], prompt, response_text, seconds, source, response)
+
+def _read_cache(prompt: str, namespace: str = ""):
+    """Return the cached response for a prompt, or None"""
+    try:
+        return get_cache(cache_file).get(prompt, namespace)
+    except Exception as e:
+        logger.warning(f"Failed to read cache, calling the LLM: {e}")
+        return None
+
+def _used_tokens(response, default: int) -> int:
+    """Total tokens reported by the API for a response, falling back to an estimate"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or default
+
+def _wait_for_rate_limit(prompt: str, model: str):
+    """Wait for the model's shared RPM/TPM budget (see utils/rate_limiter.py) instead of running into 429s"""
+    limiter = get_rate_limiter(model)
+    estimated_tokens = estimate_tokens(prompt)
+    if limiter:
+        waited = limiter.acquire(estimated_tokens)
+        if waited:
+            logger.info(f"Rate limiter: waited {waited:.1f}s before calling the LLM")
+    return limiter, estimated_tokens
+
+def _record_usage(limiter, estimated_tokens: int, response, response_text: str):
+    if limiter:
+        limiter.record_usage(estimated_tokens, _used_tokens(response, estimated_tokens + estimate_tokens(response_text or "")))
+
+def set_project(project_name: str):
+    """Tag LLM responses cached from now on (in this thread/task) with a project name"""
+    current_project.set(project_name or "")
+
+def _hedge_callbacks(stage: str, route: dict):
+    """
+    on_discard/on_hedge callbacks for hedger.call (see utils/llm_hedging.py): count hedges,
+    and charge a losing request's tokens to the rate limiter and the hedge spend.
+    Losing requests are (limiter, estimated tokens, response) tuples, or streams; the response
+    is None for an async request that was cancelled after it was sent.
+    """
+    def on_discard(result):
+        limiter, estimated_tokens, response = result[:3]
+        if response is None:  # Cancelled: only its prompt is known to have been sent
+            response_text = ""
+        elif hasattr(response, "close"):  # A stream that lost the race to its first chunk
+            response.close()
+            response, response_text = None, ""
+        else:
+            response_text = response.text or ""
+        _record_usage(limiter, estimated_tokens, response, response_text)
+        usage = getattr(response, "usage_metadata", None)
+        return metrics.record_hedge_spend(
+            stage, route["model"],
+            getattr(usage, "prompt_token_count", None) or estimated_tokens,
+            getattr(usage, "candidates_token_count", None) or estimate_tokens(response_text),
+        )
+
+    def on_hedge(outcome):
+        metrics.record_hedge(stage, outcome)
+        if outcome == "fired":
+            logger.info(f"Hedging slow LLM call for {stage or 'default'}")
+
+    return on_discard, on_hedge
+
+def _write_cache(prompt: str, response_text: str, namespace: str = ""):
+    try:
+        get_cache(cache_file).set(prompt, response_text, namespace, current_project.get())
+    except Exception as e:
+        logger.error(f"Failed to save cache: {e}")
+
+def _claim_prompt(prompt: str, namespace: str):
+    """
+    Claim a prompt across processes before calling the API.
+
+    Returns (claimed, response_text): (True, None) when this process should make the
+    call and release the claim afterwards, (False, text) when another process produced
+    the response while we waited, and (False, None) if the cache is unavailable.
+    """
+    try:
+        cache = get_cache(cache_file)
+        while not cache.acquire_lease(prompt, namespace):
+            logger.info("Identical prompt is in flight in another process, waiting for its response")
+            response_text = cache.wait_for(prompt, namespace)
+            if response_text is not None:
+                return False, response_text
+    except Exception as e:
+        logger.warning(f"Failed to claim prompt in cache, calling the LLM without deduplication: {e}")
+        return False, None
+
+    stop = threading.Event()
+    _claim_renewals[prompt_key(prompt, namespace)] = stop
+    threading.Thread(target=_renew_claim, args=(prompt, namespace, stop), name="llm-claim-renewal", daemon=True).start()
+    return True, None
+
+def _renew_claim(prompt: str, namespace: str, stop: threading.Event):
+    """Renew a claim every third of its TTL until the call holding it releases it"""
+    while not stop.wait(DEFAULT_LEASE_TTL / 3):
+        try:
+            if not get_cache(cache_file).renew_lease(prompt, namespace):
+                logger.warning("Lost the in-flight claim of a prompt; other processes may call the LLM for it too")
+                return
+        except Exception as e:
+            logger.warning(f"Failed to renew prompt claim: {e}")
+
+def _release_prompt(prompt: str, namespace: str):
+    stop = _claim_renewals.pop(prompt_key(prompt, namespace), None)
+    if stop is not None:
+        stop.set()
+    try:
+        get_cache(cache_file).release_lease(prompt, namespace)
+    except Exception as e:
+        logger.warning(f"Failed to release prompt claim: {e}")
+
+def _generate_once(prompt: str, namespace: str, generate):
+    """
+    Run generate() -> (response_text, response) at most once for identical concurrent prompts
+    and store the result in the cache. Callers that reused another call's result get response None.
+    """
+    def lead():
+        claimed, response_text = _claim_prompt(prompt, namespace)
+        if response_text is not None:
+            return response_text, None
+        try:
+            response_text, response = generate()
+            _write_cache(prompt, response_text, namespace)
+            return response_text, response
+        finally:
+            if claimed:
+                _release_prompt(prompt, namespace)
+
+    (response_text, response), shared = _flights.do(prompt_key(prompt, namespace), lead)
+    return response_text, None if shared else response
+
+# By default, we Google Gemini 2.5 pro, as it shows great performance for code understanding.
+# `stage` (the calling node's class name) selects the model from the routing table in utils/llm_routing.py.
+# With refresh_cache, a cached response is not read but replaced (e.g. when a node retries because
+# the cached response failed its validation).
+def call_llm(prompt: str, use_cache: bool = True, stage: str = None, refresh_cache: bool = False) -> str:
+    started = time.perf_counter()
+    route, client = _resolve_route(stage)
+    namespace = route_namespace(route)
+
     # Log the prompt
-    logger.info(f"PROMPT: {prompt}")
+    log_prompt(logger, stage, route["model"], prompt)
+
+    # Record/replay cassettes (see utils/llm_cassette.py) bypass the cache so every call is captured or served
+    cassette = get_cassette()
+    if cassette is not None:
+        use_cache = False
+        if cassette.mode == "replay":
+            response_text = cassette.replay(prompt, namespace)
+            _finish_call(stage, route, prompt, response_text, started, "replay")
+            return response_text
     
     # Check cache if enabled
-    if use_cache:
-        # Load cache from disk
-        cache = {}
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'r') as f:
-                    cache = json.load(f)
-            except:
-                logger.warning(f"Failed to load cache, starting with empty cache")
-        
-        # Return from cache if exists
-        if prompt in cache:
-            logger.info(f"RESPONSE: {cache[prompt]}")
-            return cache[prompt]
+    if use_cache and not refresh_cache:
+        cached_response = _read_cache(prompt, namespace)
+        if cached_response is not None:
+            _finish_call(stage, route, prompt, cached_response, started, "cache")
+            return cached_response
     
     # Call the LLM if not in cache or cache disabled
-    # Client using direct API key instead of Vertex AI
-    client = genai.Client(
-        api_key=os.getenv("GEMINI_API_KEY", "your-api-key"),
-    )
     # Commented out the Vertex AI client:
     # client = genai.Client(
     #     vertexai=True, 
@@ -53,35 +244,316 @@ def call_llm(prompt: str, use_cache: bool = True) -> str:
     #     project=os.getenv("GEMINI_PROJECT_ID", "your-project-id"),
     #     location=os.getenv("GEMINI_LOCATION", "us-central1")
     # )
-    model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
-    response = client.models.generate_content(
-        model=model,
-        contents=[prompt]
-    )
-    response_text = response.text
+    def request():
+        # Each request takes its own rate limit budget
+        limiter, estimated_tokens = _wait_for_rate_limit(prompt, route["model"])
+        response = client.models.generate_content(
+            model=route["model"],
+            contents=[prompt],
+            config=route["params"] or None
+        )
+        return limiter, estimated_tokens, response
+
+    on_discard, on_hedge = _hedge_callbacks(stage, route)
+
+    def attempt():
+        # A slow request may be raced against a duplicate (see utils/llm_hedging.py)
+        return hedger.call(stage, request, on_discard=on_discard, on_hedge=on_hedge)
+
+    retries = 0
+
+    def count_retry(exc, delay):
+        nonlocal retries
+        retries += 1
+
+    def generate():
+        if batch_mode_enabled():
+            # The prompt joins the next batch job; the batch has its own quota (see utils/llm_batch.py)
+            response = get_batcher().generate(client, route["model"], route["params"], prompt, stage)
+            return response.text, response
+        # Transient errors are retried here with backoff (see utils/llm_retry.py)
+        limiter, estimated_tokens, response = call_with_retry(
+            attempt, get_retry_policy(stage), logger, stage, on_retry=count_retry
+        )
+        response_text = response.text
+        _record_usage(limiter, estimated_tokens, response, response_text)
+        return response_text, response
+
+    if use_cache and not refresh_cache:
+        # Identical concurrent prompts wait for one call, which also updates the cache
+        response_text, response = _generate_once(prompt, namespace, generate)
+    else:
+        response_text, response = generate()
+        if use_cache:
+            _write_cache(prompt, response_text, namespace)
+    if cassette is not None:
+        cassette.record(prompt, response_text, namespace, route["model"])
     
-    # Log the response
-    logger.info(f"RESPONSE: {response_text}")
+    # Log the response and record its metrics
+    if response is not None:
+        source = "batch" if batch_mode_enabled() else "api"
+        _finish_call(stage, route, prompt, response_text, started, source, response, retries)
+    else:
+        _finish_call(stage, route, prompt, response_text, started, "dedup")
     
-    # Update cache if enabled
-    if use_cache:
-        # Load cache again to avoid overwrites
-        cache = {}
-        if os.path.exists(cache_file):
+    return response_text
+
+def call_llm_stream(prompt: str, use_cache: bool = True, stage: str = None, refresh_cache: bool = False):
+    """
+    Streaming variant of call_llm: yields the response text in chunks as they arrive.
+
+    The full response is logged and cached only after the stream completes, so an
+    interrupted stream never leaves a truncated entry in the cache. A cache hit
+    is yielded as a single chunk. With refresh_cache, the cache is not read but the
+    completed response replaces the cached one.
+    """
+    started = time.perf_counter()
+    route, client = _resolve_route(stage)
+    namespace = route_namespace(route)
+    log_prompt(logger, stage, route["model"], prompt)
+
+    cassette = get_cassette()
+    if cassette is not None:
+        use_cache = False
+        if cassette.mode == "replay":
+            response_text = cassette.replay(prompt, namespace)
+            _finish_call(stage, route, prompt, response_text, started, "replay")
+            yield response_text
+            return
+
+    flight = None
+    claimed = False
+    if use_cache and not refresh_cache:
+        cached_response = _read_cache(prompt, namespace)
+        if cached_response is not None:
+            _finish_call(stage, route, prompt, cached_response, started, "cache")
+            yield cached_response
+            return
+
+        # Identical concurrent prompts wait for this stream instead of starting their own
+        key = prompt_key(prompt, namespace)
+        flight, leader = _flights.begin(key)
+        if not leader:
+            response_text, _ = _flights.wait(flight)
+            _finish_call(stage, route, prompt, response_text, started, "dedup")
+            yield response_text
+            return
+        claimed, response_text = _claim_prompt(prompt, namespace)
+        if response_text is not None:
+            _flights.finish(key, flight, result=(response_text, None))
+            _finish_call(stage, route, prompt, response_text, started, "dedup")
+            yield response_text
+            return
+
+    if batch_mode_enabled():
+        # Batch jobs return complete responses: yield the text as a single chunk
+        try:
+            response = get_batcher().generate(client, route["model"], route["params"], prompt, stage)
+            response_text = response.text
+            if cassette is not None:
+                cassette.record(prompt, response_text, namespace, route["model"])
+            _finish_call(stage, route, prompt, response_text, started, "batch", response)
+            if use_cache:
+                _write_cache(prompt, response_text, namespace)
+        except BaseException as e:
+            if flight is not None:
+                _flights.finish(key, flight, error=e if isinstance(e, Exception) else RuntimeError(str(e)))
+            raise
+        finally:
+            if claimed:
+                _release_prompt(prompt, namespace)
+        if flight is not None:
+            _flights.finish(key, flight, result=(response_text, None))
+        yield response_text
+        return
+
+    def open_stream():
+        limiter, estimated_tokens = _wait_for_rate_limit(prompt, route["model"])
+        stream = client.models.generate_content_stream(
+            model=route["model"], contents=[prompt], config=route["params"] or None
+        )
+        return limiter, estimated_tokens, stream, next(stream, None)
+
+    on_discard, on_hedge = _hedge_callbacks(stage, route)
+
+    try:
+        policy = get_retry_policy(stage)
+        retries = 0
+        while True:
+            chunks = []
+            last_chunk = None
             try:
-                with open(cache_file, 'r') as f:
-                    cache = json.load(f)
-            except:
-                pass
-        
-        # Add to cache and save
-        cache[prompt] = response_text
+                # Streams are hedged on the time to their first chunk (see utils/llm_hedging.py)
+                limiter, estimated_tokens, stream, first_chunk = hedger.call(
+                    stage, open_stream, on_discard=on_discard, on_hedge=on_hedge, series=f"{stage}:first_chunk"
+                )
+                for chunk in itertools.chain([first_chunk] if first_chunk is not None else [], stream):
+                    last_chunk = chunk
+                    if chunk.text:
+                        chunks.append(chunk.text)
+                        yield chunk.text
+                break
+            except Exception as e:
+                # Only retry before anything was yielded; a broken stream is left to the caller
+                delay = None if chunks else policy.retry_delay(e, retries, time.perf_counter() - started)
+                if delay is None:
+                    raise
+                logger.warning(f"LLM stream for {stage or 'default'} failed ({classify_error(e)}: {e}), "
+                               f"retry {retries + 1}/{policy.max_attempts - 1} in {delay:.1f}s")
+                time.sleep(delay)
+                retries += 1
+        response_text = "".join(chunks)
+        _record_usage(limiter, estimated_tokens, last_chunk, response_text)
+        if cassette is not None:
+            cassette.record(prompt, response_text, namespace, route["model"])
+
+        _finish_call(stage, route, prompt, response_text, started, "api", last_chunk, retries)
+
+        if use_cache:
+            _write_cache(prompt, response_text, namespace)
+    except BaseException as e:
+        if flight is not None:
+            # GeneratorExit means our consumer stopped reading; waiters get a regular error
+            error = e if isinstance(e, Exception) else RuntimeError("LLM stream was closed before it completed")
+            _flights.finish(key, flight, error=error)
+        raise
+    finally:
+        if claimed:
+            _release_prompt(prompt, namespace)
+    if flight is not None:
+        _flights.finish(key, flight, result=(response_text, None))
+
+def set_max_concurrency(limit: int):
+    """Change the acall_llm concurrency limit (applies to event loops that start using it afterwards)"""
+    global max_concurrency
+    max_concurrency = limit
+    _semaphores.clear()
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+async def acall_llm(prompt: str, use_cache: bool = True, stage: str = None, refresh_cache: bool = False) -> str:
+    """
+    Async variant of call_llm sharing its cache and logging (including refresh_cache).
+
+    At most `max_concurrency` requests (LLM_MAX_CONCURRENCY, default 8) are in
+    flight per event loop; extra callers wait on the semaphore, so many prompts
+    can be awaited together without one OS thread per request.
+    """
+    started = time.perf_counter()
+    route, client = _resolve_route(stage)
+    namespace = route_namespace(route)
+    log_prompt(logger, stage, route["model"], prompt)
+
+    cassette = get_cassette()
+    if cassette is not None:
+        use_cache = False
+        if cassette.mode == "replay":
+            response_text = cassette.replay(prompt, namespace)
+            _finish_call(stage, route, prompt, response_text, started, "replay")
+            return response_text
+
+    # Cache reads/writes hit SQLite, keep them off the event loop
+    if use_cache and not refresh_cache:
+        cached_response = await asyncio.to_thread(_read_cache, prompt, namespace)
+        if cached_response is not None:
+            _finish_call(stage, route, prompt, cached_response, started, "cache")
+            return cached_response
+
+    limiter = get_rate_limiter(route["model"])
+    estimated_tokens = estimate_tokens(prompt)
+
+    async def request(sent):
+        # Wait for rate limit budget before taking a concurrency slot
+        if limiter:
+            waited = await limiter.acquire_async(estimated_tokens)
+            if waited:
+                logger.info(f"Rate limiter: waited {waited:.1f}s before calling the LLM")
+        # From here on the request takes budget (and is paid for) even if it is cancelled
+        sent.append(True)
+
+        # The shared client's async connections belong to the first event loop that used them
+        aio_client = get_async_client(route["provider"], api_key=os.getenv("GEMINI_API_KEY", "your-api-key"), model=route["model"])
+        async with _get_semaphore():
+            return await aio_client.aio.models.generate_content(
+                model=route["model"],
+                contents=[prompt],
+                config=route["params"] or None
+            )
+
+    on_discard, on_hedge = _hedge_callbacks(stage, route)
+
+    async def attempt():
+        sent = []  # One entry per request of this attempt that got past the rate limiter
+
+        def discard(response):
+            # A loser cancelled before it got past the rate limiter cost nothing
+            if response is None and len(sent) < 2:
+                return 0.0
+            return on_discard((limiter, estimated_tokens, response))
+
+        # A slow request may be raced against a duplicate, which cancels the loser
+        return await hedger.acall(stage, lambda: request(sent), on_discard=discard, on_hedge=on_hedge)
+
+    retries = 0
+
+    def count_retry(exc, delay):
+        nonlocal retries
+        retries += 1
+
+    async def generate():
+        if batch_mode_enabled():
+            # Wait for the batch job in a worker thread (see utils/llm_batch.py)
+            response = await asyncio.to_thread(
+                get_batcher().generate, client, route["model"], route["params"], prompt, stage
+            )
+            return response.text, response
+        # Backoff sleeps happen outside the semaphore, so they do not hold a concurrency slot
+        response = await acall_with_retry(attempt, get_retry_policy(stage), logger, stage, on_retry=count_retry)
+        response_text = response.text
+
+        if limiter:
+            await asyncio.to_thread(
+                limiter.record_usage, estimated_tokens,
+                _used_tokens(response, estimated_tokens + estimate_tokens(response_text or ""))
+            )
+        return response_text, response
+
+    async def lead():
+        # Same as _generate_once, with the blocking cache work moved off the event loop
+        claimed, response_text = await asyncio.to_thread(_claim_prompt, prompt, namespace)
+        if response_text is not None:
+            return response_text, None
         try:
-            with open(cache_file, 'w') as f:
-                json.dump(cache, f)
-        except Exception as e:
-            logger.error(f"Failed to save cache: {e}")
-    
+            response_text, response = await generate()
+            await asyncio.to_thread(_write_cache, prompt, response_text, namespace)
+            return response_text, response
+        finally:
+            if claimed:
+                await asyncio.to_thread(_release_prompt, prompt, namespace)
+
+    if use_cache and not refresh_cache:
+        (response_text, response), shared = await _async_flights.do(prompt_key(prompt, namespace), lead)
+        if shared:
+            response = None
+    else:
+        response_text, response = await generate()
+        if use_cache:
+            await asyncio.to_thread(_write_cache, prompt, response_text, namespace)
+
+    if response is not None:
+        source = "batch" if batch_mode_enabled() else "api"
+        _finish_call(stage, route, prompt, response_text, started, source, response, retries)
+    else:
+        _finish_call(stage, route, prompt, response_text, started, "dedup")
+    if cassette is not None:
+        await asyncio.to_thread(cassette.record, prompt, response_text, namespace, route["model"])
+
     return response_text
 
 # # Use Anthropic Claude 3.7 Sonnet Extended Thinking
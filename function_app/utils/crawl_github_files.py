@@ -1,12 +1,130 @@
 import requests
 import base64
+import io
 import os
 import tempfile
 # import git
 import time
 import fnmatch
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, Set, List, Dict, Tuple, Any
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote
+
+try:
+    from utils.github_cache import get_github_cache
+    from utils.github_rate_limit import get_github_rate_limiter, token_pool, MAX_RETRIES
+    # from utils.git_mirror import DEFAULT_MIRROR_DIR, mirror_commit, fetch_blobs, evict_mirrors
+except ImportError:  # Running this file directly (python utils/crawl_github_files.py)
+    from github_cache import get_github_cache
+    from github_rate_limit import get_github_rate_limiter, token_pool, MAX_RETRIES
+    # from git_mirror import DEFAULT_MIRROR_DIR, mirror_commit, fetch_blobs, evict_mirrors
+
+# How files of GitHub repositories are fetched by default:
+#   "api"     -> list the tree, then download each matching file
+#   "archive" -> stream the repository tarball once and keep the matching files
+DEFAULT_INGEST = os.getenv("GITHUB_INGEST", "api")
+
+# Number of files downloaded at the same time (per crawl), over one pooled keep-alive session
+MAX_DOWNLOAD_WORKERS = int(os.getenv("GITHUB_DOWNLOAD_WORKERS", "8"))
+
+# Git file mode of symbolic links (skipped when reading files from a mirror)
+SYMLINK_MODE = 0o120000
+
+# Downloads are read in chunks, so an oversized or binary file is abandoned early
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+BINARY_SNIFF_BYTES = 8000  # Same heuristic as git: a NUL byte in the first 8000 bytes means binary
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Process-wide requests session, with a connection pool large enough for the download workers"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(10, MAX_DOWNLOAD_WORKERS))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def sparse_checkout_patterns(include_patterns, exclude_patterns):
+    """
+    Translate include/exclude patterns into non-cone sparse-checkout patterns, or None to
+    check out everything. The result may select more files than the patterns (they are
+    applied again while walking the checkout) but never fewer.
+    """
+    if not include_patterns or any("/" in pattern for pattern in include_patterns):
+        # Include patterns are matched against file names; with a path in one, check out everything
+        return None
+    patterns = sorted(include_patterns)
+    for pattern in sorted(exclude_patterns or ()):
+        if "/" not in pattern:
+            # Matches names at any depth, like the full-path fnmatch of a "*"-prefixed pattern
+            if pattern.startswith("*"):
+                patterns.append(f"!{pattern}")
+        elif pattern.endswith("/*") and not any(c in pattern[:-2] for c in "*?["):
+            # "dir/*": everything below a top-level directory
+            patterns.append(f"!/{pattern[:-2]}/")
+    return patterns
+
+def is_excluded_dir(dir_path: str, exclude_patterns) -> bool:
+    """
+    Whether every file below a directory is excluded, so a walk can skip it: an exclude
+    pattern ending in "*" that matches "dir/" also matches every path below it.
+    """
+    return any(pattern.endswith("*") and fnmatch.fnmatch(dir_path + "/", pattern) for pattern in exclude_patterns or ())
+
+# def clone_shallow(repo_url: str, directory: str, ref: str = None, sparse_patterns=None) -> str:
+#     """
+#     Check out a single commit of a remote repository: only that commit is fetched (depth 1),
+#     file contents are downloaded lazily (blob filter) and only for the files selected by
+#     the sparse-checkout patterns.
+
+#     Args:
+#         repo_url (str): Remote URL (e.g. git@github.com:owner/repo.git)
+#         directory (str): Empty directory to check out into
+#         ref (str, optional): Branch, tag or commit SHA (default: the remote's default branch)
+#         sparse_patterns (list, optional): Non-cone sparse-checkout patterns (None = all files)
+
+#     Returns:
+#         str: SHA of the checked-out commit
+#     """
+#     repo = git.Repo.init(directory)
+#     repo.git.remote("add", "origin", repo_url)
+#     repo.git.fetch("--depth=1", "--filter=blob:none", "--no-tags", "origin", ref or "HEAD")
+#     if sparse_patterns is not None:
+#         repo.git.sparse_checkout("set", "--no-cone", *sparse_patterns)
+#     repo.git.checkout("--detach", "FETCH_HEAD")
+#     return repo.head.commit.hexsha
+
+def is_ssh_url(repo_url: str) -> bool:
+    """Whether a repository is cloned with git (git@ or .git suffix) instead of read through the API"""
+    return repo_url.startswith("git@") or repo_url.endswith(".git")
+
+def is_binary(head: bytes) -> bool:
+    """Whether content looks binary, judging from its first bytes"""
+    return b"\0" in head[:BINARY_SNIFF_BYTES]
+
+def decode_text(content: bytes) -> Union[str, None]:
+    """
+    Decode file content as UTF-8, or return None if it is not UTF-8 text. Every crawl
+    path (downloads, archive and cloned files) applies this rule.
+    """
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def diff_manifests(previous_files: Dict[str, str], files: Dict[str, str]) -> Dict[str, List[str]]:
+    """Change list between two crawls of a repository, by comparing file contents"""
+    return {
+        "added": [path for path in files if path not in previous_files],
+        "modified": [path for path in files if path in previous_files and previous_files[path] != files[path]],
+        "removed": [path for path in previous_files if path not in files],
+    }
 
 def crawl_github_files(
     repo_url, 
@@ -14,7 +132,11 @@ def crawl_github_files(
     max_file_size: int = 1 * 1024 * 1024,  # 1 MB
     use_relative_paths: bool = False,
     include_patterns: Union[str, Set[str]] = None,
-    exclude_patterns: Union[str, Set[str]] = None
+    exclude_patterns: Union[str, Set[str]] = None,
+    ingest: str = None,
+    ref: str = None,
+    previous_commit: str = None,
+    previous_files: Dict[str, str] = None
 ):
     """
     Crawl files from a specific path in a GitHub repository at a specific commit.
@@ -32,10 +154,20 @@ def crawl_github_files(
                                                        If None, all files are included.
         exclude_patterns (str or set of str, optional): Pattern or set of patterns specifying which files to exclude.
                                                        If None, no files are excluded.
+        ingest (str, optional): "api" to download matching files one by one, or "archive" to stream
+                                the repository tarball in a single request (default: GITHUB_INGEST or "api")
+        ref (str, optional): Branch, tag or commit to crawl when the URL does not name one
+                             (SSH URLs never do; default: the repository's default branch)
+        previous_commit (str, optional): Commit SHA of an earlier crawl of the same repository, path and patterns
+        previous_files (dict, optional): Files returned by that crawl. With both, only the files changed
+                                         between the two commits are downloaded and merged into these
 
     Returns:
-        dict: Dictionary with files and statistics
+        dict: Dictionary with files and statistics. stats["changes"] lists the "added", "modified"
+              and "removed" paths relative to previous_files (None without previous_files)
     """
+    ingest = ingest or DEFAULT_INGEST
+
     # Convert single pattern to set
     if include_patterns and isinstance(include_patterns, str):
         include_patterns = {include_patterns}
@@ -60,69 +192,111 @@ def crawl_github_files(
         return include_file
 
     # # Detect SSH URL (git@ or .git suffix)
-    # is_ssh_url = repo_url.startswith("git@") or repo_url.endswith(".git")
-
-    # if is_ssh_url:
-    #     # Clone repo via SSH to temp dir
-    #     with tempfile.TemporaryDirectory() as tmpdirname:
-    #         print(f"Cloning SSH repo {repo_url} to temp dir {tmpdirname} ...")
+    # if is_ssh_url(repo_url):
+    #     files = {}
+    #     skipped_files = []
+
+    #     def add_local_file(rel_path: str, filename: str, get_size, open_file):
+    #         """
+    #         Check a cloned file against the patterns and size limit, then read it from the
+    #         binary file object open_file() returns, skipping binary and non-UTF-8 content
+    #         like the API paths do.
+    #         """
+    #         # Check include/exclude patterns
+    #         if not should_include_file(rel_path, filename):
+    #             print(f"Skipping {rel_path}: does not match include/exclude patterns")
+    #             return
+
+    #         file_size = get_size()
+    #         if file_size > max_file_size:
+    #             skipped_files.append((rel_path, file_size))
+    #             print(f"Skipping {rel_path}: size {file_size} exceeds limit {max_file_size}")
+    #             return
+
+    #         # Read content, looking at the first bytes before reading a binary file to the end
+    #         try:
+    #             with open_file() as f:
+    #                 head = f.read(BINARY_SNIFF_BYTES)
+    #                 if is_binary(head):
+    #                     print(f"Skipping {rel_path}: binary content")
+    #                     return
+    #                 content = decode_text(head + f.read())
+    #         except Exception as e:
+    #             print(f"Failed to read {rel_path}: {e}")
+    #             return
+    #         if content is None:
+    #             print(f"Skipping {rel_path}: not UTF-8 text")
+    #             return
+    #         files[rel_path] = content
+    #         print(f"Added {rel_path} ({file_size} bytes)")
+
+    #     if DEFAULT_MIRROR_DIR:
+    #         # Update the persistent bare mirror and read files straight from its object store
+    #         print(f"Updating mirror of SSH repo {repo_url} ({ref or 'default branch'}) in {DEFAULT_MIRROR_DIR} ...")
     #         try:
-    #             repo = git.Repo.clone_from(repo_url, tmpdirname)
+    #             with mirror_commit(repo_url, ref, DEFAULT_MIRROR_DIR) as commit:
+    #                 commit_sha = commit.hexsha
+    #                 blobs = commit.tree.traverse(
+    #                     predicate=lambda item, depth: item.type == "blob" and item.mode != SYMLINK_MODE,
+    #                     prune=lambda item, depth: item.type == "tree" and is_excluded_dir(item.path, exclude_patterns),
+    #                 )
+    #                 blobs = sorted(blobs, key=lambda b: b.path)
+    #                 # The mirror has no file contents yet: fetch those of the matching files at once
+    #                 fetch_blobs(commit, [blob for blob in blobs if should_include_file(blob.path, blob.name)])
+    #                 for blob in blobs:
+    #                     # A git object stream has to be read to the end, and the blob fits the size limit
+    #                     add_local_file(blob.path, blob.name, lambda: blob.size,
+    #                                    lambda: io.BytesIO(blob.data_stream.read()))
     #         except Exception as e:
-    #             print(f"Error cloning repo: {e}")
+    #             print(f"Error updating mirror: {e}")
     #             return {"files": {}, "stats": {"error": str(e)}}
-
-    #         # Attempt to checkout specific commit/branch if in URL
-    #         # Parse ref and subdir from SSH URL? SSH URLs don't have branch info embedded
-    #         # So rely on default branch, or user can checkout manually later
-    #         # Optionally, user can pass ref explicitly in future API
-
-    #         # Walk directory
-    #         files = {}
-    #         skipped_files = []
-
-    #         for root, dirs, filenames in os.walk(tmpdirname):
-    #             for filename in filenames:
-    #                 abs_path = os.path.join(root, filename)
-    #                 rel_path = os.path.relpath(abs_path, tmpdirname)
-
-    #                 # Check file size
-    #                 try:
-    #                     file_size = os.path.getsize(abs_path)
-    #                 except OSError:
-    #                     continue
-
-    #                 if file_size > max_file_size:
-    #                     skipped_files.append((rel_path, file_size))
-    #                     print(f"Skipping {rel_path}: size {file_size} exceeds limit {max_file_size}")
-    #                     continue
-
-    #                 # Check include/exclude patterns
-    #                 if not should_include_file(rel_path, filename):
-    #                     print(f"Skipping {rel_path}: does not match include/exclude patterns")
-    #                     continue
-
-    #                 # Read content
-    #                 try:
-    #                     with open(abs_path, "r", encoding="utf-8") as f:
-    #                         content = f.read()
-    #                     files[rel_path] = content
-    #                     print(f"Added {rel_path} ({file_size} bytes)")
-    #                 except Exception as e:
-    #                     print(f"Failed to read {rel_path}: {e}")
-
-    #         return {
-    #             "files": files,
-    #             "stats": {
-    #                 "downloaded_count": len(files),
-    #                 "skipped_count": len(skipped_files),
-    #                 "skipped_files": skipped_files,
-    #                 "base_path": None,
-    #                 "include_patterns": include_patterns,
-    #                 "exclude_patterns": exclude_patterns,
-    #                 "source": "ssh_clone"
-    #             }
+    #         evict_mirrors(DEFAULT_MIRROR_DIR)
+    #         source = "git_mirror"
+    #     else:
+    #         # Shallow, blob-filtered, sparse clone via SSH to temp dir
+    #         with tempfile.TemporaryDirectory() as tmpdirname:
+    #             print(f"Cloning SSH repo {repo_url} ({ref or 'default branch'}) to temp dir {tmpdirname} ...")
+    #             try:
+    #                 commit_sha = clone_shallow(repo_url, tmpdirname, ref, sparse_checkout_patterns(include_patterns, exclude_patterns))
+    #             except Exception as e:
+    #                 print(f"Error cloning repo: {e}")
+    #                 return {"files": {}, "stats": {"error": str(e)}}
+
+    #             # Walk directory
+    #             for root, dirs, filenames in os.walk(tmpdirname):
+    #                 # Never descend into .git or directories whose whole content is excluded
+    #                 rel_root = os.path.relpath(root, tmpdirname)
+    #                 dirs[:] = sorted(
+    #                     d for d in dirs
+    #                     if d != ".git" and not is_excluded_dir(os.path.normpath(os.path.join(rel_root, d)), exclude_patterns)
+    #                 )
+    #                 for filename in sorted(filenames):
+    #                     abs_path = os.path.join(root, filename)
+    #                     rel_path = os.path.relpath(abs_path, tmpdirname)
+
+    #                     # Check file size
+    #                     try:
+    #                         file_size = os.path.getsize(abs_path)
+    #                     except OSError:
+    #                         continue
+
+    #                     add_local_file(rel_path, filename, lambda: file_size, lambda: open(abs_path, "rb"))
+    #         source = "ssh_clone"
+
+    #     return {
+    #         "files": files,
+    #         "stats": {
+    #             "downloaded_count": len(files),
+    #             "skipped_count": len(skipped_files),
+    #             "skipped_files": skipped_files,
+    #             "base_path": None,
+    #             "include_patterns": include_patterns,
+    #             "exclude_patterns": exclude_patterns,
+    #             "commit_sha": commit_sha,
+    #             "changes": diff_manifests(previous_files, files) if previous_files is not None else None,
+    #             "source": source
     #         }
+    #     }
 
     # Parse GitHub URL to extract owner, repo, commit/branch, and path
     parsed_url = urlparse(repo_url)
@@ -136,15 +310,69 @@ def crawl_github_files(
     repo = path_parts[1]
     
     # Setup for GitHub API
+    session = get_session()
     headers = {"Accept": "application/vnd.github.v3+json"}
-    if token:
-        headers["Authorization"] = f"token {token}"
+    # Every request (API calls as well as file and archive downloads) rotates through
+    # the token pool (see utils/github_rate_limit.py)
+    tokens = token_pool(token)
+    rate_limiter = get_github_rate_limiter()
+
+    def token_headers(request_token, accept=None):
+        """Request headers authenticated with a token of the pool (None = anonymous)"""
+        request_headers = dict(headers)
+        if accept:
+            request_headers["Accept"] = accept
+        if request_token:
+            request_headers["Authorization"] = f"token {request_token}"
+        return request_headers
+
+    # Conditional requests: unchanged responses come back as 304s, which do not count
+    # against the rate limit, and are served from the local cache. The same cache stores
+    # file contents by git blob SHA (see utils/github_cache.py)
+    http_cache = get_github_cache()
+    cached_responses = 0
+    reused_blobs = 0
+    cached_lock = threading.Lock()
+
+    def http_get(url, request_headers=None, params=None):
+        """GET a URL, through the conditional-request cache when it is enabled"""
+        nonlocal cached_responses
+        if http_cache is None:
+            return session.get(url, headers=request_headers or headers, params=params)
+        response = http_cache.get(session, url, headers=request_headers or headers, params=params)
+        if response.from_cache:
+            with cached_lock:
+                cached_responses += 1
+        return response
+
+    api_requests = 0
+    rate_lock = threading.Lock()
+
+    def github_get(url, params=None, accept=None):
+        """
+        GET a GitHub API URL with the token the rate limiter picks. The limiter paces requests
+        before a token's budget runs out; a request that is rate limited anyway is sent again
+        (with another token, or once the budget has reset) at most MAX_RETRIES times.
+        """
+        nonlocal api_requests
+        for attempt in range(MAX_RETRIES + 1):
+            api_token = rate_limiter.acquire(tokens)
+            response = http_get(url, token_headers(api_token, accept), params)
+            with rate_lock:
+                api_requests += 1
+
+            wait_time = rate_limiter.update(api_token, response)
+            if wait_time is None:
+                return response
+            print(f"Rate limit exceeded ({attempt + 1}/{MAX_RETRIES + 1}), token budget resets in {wait_time:.0f} seconds")
+        print(f"Giving up on {url}: still rate limited after {MAX_RETRIES + 1} attempts")
+        return response
 
     def fetch_branches(owner: str, repo: str):
         """Get brancshes of the repository"""
 
         url = f"https://api.github.com/repos/{owner}/{repo}/branches"
-        response = requests.get(url, headers=headers)
+        response = github_get(url)
 
         if response.status_code == 404:
             if not token:
@@ -165,7 +393,7 @@ def crawl_github_files(
         """Check the repository has the given tree"""
 
         url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{tree}"
-        response = requests.get(url, headers=headers)
+        response = github_get(url)
 
         return True if response.status_code == 200 else False 
 
@@ -202,122 +430,392 @@ def crawl_github_files(
         part_index = 5 if '/' in ref else 4
         specific_path = join_parts(part_index) if part_index < len(path_parts) else ""
     else:
-        # Dont put the ref param to quiery
+        # Without an explicit ref, dont put the ref param to quiery
         # and let Github decide default branch
-        ref = None
         specific_path = ""
     
     # Dictionary to store path -> content mapping
     files = {}
     skipped_files = []
-    
-    def fetch_contents(path):
-        """Fetch contents of the repository at a specific path and commit"""
-        url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
-        params = {"ref": ref} if ref != None else {}
-        
-        response = requests.get(url, headers=headers, params=params)
-        
-        if response.status_code == 403 and 'rate limit exceeded' in response.text.lower():
-            reset_time = int(response.headers.get('X-RateLimit-Reset', 0))
-            wait_time = max(reset_time - time.time(), 0) + 1
-            print(f"Rate limit exceeded. Waiting for {wait_time:.0f} seconds...")
-            time.sleep(wait_time)
-            return fetch_contents(path)
-            
-        if response.status_code == 404:
-            if not token:
-                print(f"Error 404: Repository not found or is private.\n"
-                      f"If this is a private repository, please provide a valid GitHub token via the 'token' argument or set the GITHUB_TOKEN environment variable.")
-            elif not path and ref == 'main':
-                print(f"Error 404: Repository not found. Check if the default branch is not 'main'\n"
-                      f"Try adding branch name to the request i.e. python main.py --repo https://github.com/username/repo/tree/master")
-            else:
-                print(f"Error 404: Path '{path}' not found in repository or insufficient permissions with the provided token.\n"
-                      f"Please verify the token has access to this repository and the path exists.")
-            return
-            
+
+    def print_not_found(path):
+        if not token:
+            print(f"Error 404: Repository not found or is private.\n"
+                  f"If this is a private repository, please provide a valid GitHub token via the 'token' argument or set the GITHUB_TOKEN environment variable.")
+        elif not path and ref == 'main':
+            print(f"Error 404: Repository not found. Check if the default branch is not 'main'\n"
+                  f"Try adding branch name to the request i.e. python main.py --repo https://github.com/username/repo/tree/master")
+        else:
+            print(f"Error 404: Path '{path}' not found in repository or insufficient permissions with the provided token.\n"
+                  f"Please verify the token has access to this repository and the path exists.")
+
+    def resolve_commit(ref):
+        """Resolve a branch, tag or commit (None for the default branch) to a commit SHA"""
+        url = f"https://api.github.com/repos/{owner}/{repo}/commits/{ref or 'HEAD'}"
+        response = github_get(url, accept="application/vnd.github.sha")
+
+        if response.status_code in (404, 422):
+            print_not_found("")
+            return None
+        if response.status_code != 200:
+            print(f"Error resolving {ref or 'the default branch'}: {response.status_code} - {response.text}")
+            return None
+        return response.text.strip()
+
+    def fetch_tree(tree_sha, recursive, missing_ok=False):
+        """Fetch a git tree, with all its descendants if recursive (None if it cannot be fetched)"""
+        url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{tree_sha}"
+        response = github_get(url, params={"recursive": "1"} if recursive else None)
+
+        if missing_ok and response.status_code in (404, 422):
+            return None
         if response.status_code != 200:
-            print(f"Error fetching {path}: {response.status_code} - {response.text}")
+            print(f"Error fetching tree {tree_sha}: {response.status_code} - {response.text}")
+            return None
+        return response.json()
+
+    def in_scope(dir_path):
+        """Whether a directory is on the way to, or inside, the requested path"""
+        return (not specific_path or dir_path == specific_path
+                or dir_path.startswith(specific_path + "/") or specific_path.startswith(dir_path + "/"))
+
+    def list_tree(tree_sha, prefix="", data=None):
+        """
+        Yield (path, entry) for every entry below a tree. The whole tree comes from one
+        request (or is given as data) unless GitHub truncates it (over 100,000 entries
+        or 7 MB); then this level is listed on its own and each relevant sub-tree is
+        listed separately.
+        """
+        if data is None:
+            data = fetch_tree(tree_sha, recursive=True)
+        if data is None:
             return
-        
-        contents = response.json()
-        
-        # Handle both single file and directory responses
-        if not isinstance(contents, list):
-            contents = [contents]
-        
-        for item in contents:
-            item_path = item["path"]
-            
-            # Calculate relative path if requested
-            if use_relative_paths and specific_path:
-                # Make sure the path is relative to the specified subdirectory
-                if item_path.startswith(specific_path):
-                    rel_path = item_path[len(specific_path):].lstrip('/')
-                else:
-                    rel_path = item_path
+        if not data.get("truncated"):
+            for entry in data["tree"]:
+                yield prefix + entry["path"], entry
+            return
+
+        print(f"Tree listing of '{prefix or '/'}' is truncated, listing its sub-trees separately")
+        data = fetch_tree(tree_sha, recursive=False)
+        if data is None:
+            return
+        for entry in data["tree"]:
+            entry_path = prefix + entry["path"]
+            if entry["type"] == "tree":
+                if in_scope(entry_path):
+                    yield from list_tree(entry["sha"], entry_path + "/")
             else:
-                rel_path = item_path
-            
-            if item["type"] == "file":
-                # Check if file should be included based on patterns
-                if not should_include_file(rel_path, item["name"]):
-                    print(f"Skipping {rel_path}: Does not match include/exclude patterns")
-                    continue
-                
-                # Check file size if available
-                file_size = item.get("size", 0)
-                if file_size > max_file_size:
-                    skipped_files.append((item_path, file_size))
-                    print(f"Skipping {rel_path}: File size ({file_size} bytes) exceeds limit ({max_file_size} bytes)")
-                    continue
-                
-                # For files, get raw content
-                if "download_url" in item and item["download_url"]:
-                    file_url = item["download_url"]
-                    file_response = requests.get(file_url, headers=headers)
-                    
-                    # Final size check in case content-length header is available but differs from metadata
-                    content_length = int(file_response.headers.get('content-length', 0))
-                    if content_length > max_file_size:
-                        skipped_files.append((item_path, content_length))
-                        print(f"Skipping {rel_path}: Content length ({content_length} bytes) exceeds limit ({max_file_size} bytes)")
+                yield entry_path, entry
+
+    def list_requested_path():
+        """Yield (path, entry) for every entry below the requested path of the commit"""
+        if specific_path:
+            # "<commit>:<path>" names the tree of the requested directory, so only that
+            # part of the repository is listed
+            tree_sha = f"{commit_sha}:{quote(specific_path)}"
+            data = fetch_tree(tree_sha, recursive=True, missing_ok=True)
+            if data is not None:
+                yield from list_tree(tree_sha, specific_path + "/", data)
+                return
+            # Not a directory (e.g. a single file): list from the root and filter
+        yield from list_tree(commit_sha)
+
+    def read_capped(response, rel_path, file_size):
+        """
+        Read a streamed response body in chunks, stopping as soon as it exceeds the size
+        limit or turns out to be binary. Returns ("file", content), ("skipped", size) or None.
+        """
+        content_length = int(response.headers.get('content-length', 0))
+        if content_length > max_file_size:
+            print(f"Skipping {rel_path}: Content length ({content_length} bytes) exceeds limit ({max_file_size} bytes)")
+            return "skipped", content_length
+
+        content = bytearray()
+        sniffed = False
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            content += chunk
+            if len(content) > max_file_size:
+                print(f"Skipping {rel_path}: Download exceeds limit ({max_file_size} bytes)")
+                return "skipped", max(file_size, len(content))
+            if not sniffed and len(content) >= BINARY_SNIFF_BYTES:
+                sniffed = True
+                if is_binary(content):
+                    print(f"Skipping {rel_path}: binary content")
+                    return None
+        if not sniffed and is_binary(content):
+            print(f"Skipping {rel_path}: binary content")
+            return None
+        return "file", bytes(content)
+
+    def text_file(rel_path, content):
+        """("file", text) for UTF-8 content, None (skipped) otherwise"""
+        text = decode_text(content)
+        if text is None:
+            print(f"Skipping {rel_path}: not UTF-8 text")
+            return None
+        return "file", text
+
+    def download_file(item_path, rel_path, entry):
+        """
+        Download one file of the commit (runs in a download worker).
+        Returns ("file", content), ("skipped", size) or None if it could not be downloaded,
+        is binary or is not UTF-8 text.
+        """
+        nonlocal reused_blobs
+        file_size = entry.get("size", 0)
+
+        # Content seen before (in any ref, fork or earlier crawl) comes from the blob store
+        if http_cache is not None:
+            content = http_cache.get_blob(entry["sha"])
+            if content is not None:
+                with cached_lock:
+                    reused_blobs += 1
+                print(f"Reused: {rel_path} ({file_size} bytes)")
+                return text_file(rel_path, content)
+
+        # Raw file content (not counted against the API rate limit), sent with a token of the
+        # pool and retried if throttled. Contents are immutable at a commit, so they are stored
+        # by blob SHA instead of going through the conditional-request cache
+        file_url = f"https://raw.githubusercontent.com/{owner}/{repo}/{commit_sha}/{quote(item_path)}"
+        file_response = None
+        for attempt in range(MAX_RETRIES + 1):
+            raw_token = rate_limiter.acquire(tokens, spend=False)
+            file_response = session.get(file_url, headers=token_headers(raw_token), stream=True)
+            wait_time = rate_limiter.update(raw_token, file_response)
+            if wait_time is None:
+                break
+            print(f"Raw download of {rel_path} rate limited ({attempt + 1}/{MAX_RETRIES + 1}), token budget resets in {wait_time:.0f} seconds")
+            file_response.close()
+            file_response = None
+
+        if file_response is not None:
+            with file_response:
+                if file_response.status_code == 200:
+                    result = read_capped(file_response, rel_path, file_size)
+                    if result is None or result[0] == "skipped":
+                        return result
+                    raw_content = result[1]
+                    print(f"Downloaded: {rel_path} ({len(raw_content)} bytes)")
+                    if http_cache is not None:
+                        http_cache.put_blob(raw_content, entry["sha"])
+                    return text_file(rel_path, raw_content)
+
+        # Alternative method if the raw download fails: the blob, base64 encoded
+        content_response = github_get(f"https://api.github.com/repos/{owner}/{repo}/git/blobs/{entry['sha']}")
+        if content_response.status_code == 200:
+            content_data = content_response.json()
+            if content_data.get("encoding") == "base64" and "content" in content_data:
+                encoded = content_data["content"]
+                # Check the size (given by the API, or estimated) before decoding
+                blob_size = content_data.get("size") or int(len(encoded) * 0.75)
+                if blob_size > max_file_size:
+                    print(f"Skipping {rel_path}: Blob size ({blob_size} bytes) exceeds limit ({max_file_size} bytes)")
+                    return "skipped", blob_size
+
+                # Decode only the first bytes to detect binary content. The encoding is
+                # wrapped in lines; base64 decodes in groups of 4 characters
+                sniff_chars = BINARY_SNIFF_BYTES // 3 * 4
+                if is_binary(base64.b64decode("".join(encoded[:2 * sniff_chars].split())[:sniff_chars])):
+                    print(f"Skipping {rel_path}: binary content")
+                    return None
+
+                raw_content = base64.b64decode(encoded)
+                print(f"Downloaded: {rel_path} ({len(raw_content)} bytes)")
+                if http_cache is not None:
+                    http_cache.put_blob(raw_content, entry["sha"])
+                return text_file(rel_path, raw_content)
+            else:
+                print(f"Unexpected content format for {rel_path}")
+        else:
+            print(f"Failed to get content for {rel_path}: {content_response.status_code}")
+        return None
+
+    def relative_path(item_path):
+        """Path of a file as returned to the caller, or None if it is outside the requested path"""
+        if specific_path and item_path != specific_path and not item_path.startswith(specific_path + "/"):
+            return None
+
+        # Calculate relative path if requested
+        if use_relative_paths and specific_path:
+            return item_path[len(specific_path):].lstrip('/')
+        return item_path
+
+    def select_file(item_path, file_size):
+        """Apply the path, pattern and size filters to a file. Returns its relative path, or None to skip it."""
+        rel_path = relative_path(item_path)
+        if rel_path is None:
+            return None
+
+        # Check if file should be included based on patterns
+        if not should_include_file(rel_path, item_path.rsplit("/", 1)[-1]):
+            print(f"Skipping {rel_path}: Does not match include/exclude patterns")
+            return None
+
+        # Check file size
+        if file_size > max_file_size:
+            skipped_files.append((item_path, file_size))
+            print(f"Skipping {rel_path}: File size ({file_size} bytes) exceeds limit ({max_file_size} bytes)")
+            return None
+        return rel_path
+
+    def download_all(to_download):
+        """
+        Download (item_path, rel_path, entry) items in parallel, but yield the results in
+        the given order so the files (and the prompts built from them) are the same on every run
+        """
+        with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as pool:
+            yield from zip(to_download, pool.map(lambda item: download_file(*item), to_download))
+
+    def compare_commits(base, head):
+        """
+        Files changed between two commits, from the compare API. Returns None if the change
+        list is unavailable, may be incomplete (GitHub lists at most 300 files), or is not
+        the difference between the two commits.
+        """
+        url = f"https://api.github.com/repos/{owner}/{repo}/compare/{base}...{head}"
+        # The changed files are all on the first page; one commit per page keeps it small
+        response = github_get(url, params={"per_page": "1"})
+        if response.status_code != 200:
+            print(f"Error comparing {base[:12]}...{head[:12]}: {response.status_code} - {response.text[:200]}")
+            return None
+        data = response.json()
+        # A three-dot comparison diffs against the merge base: it only equals the change
+        # from base to head when head descends from base (not after a force push or a
+        # switch to another branch)
+        if data.get("status") not in ("ahead", "identical"):
+            print(f"{head[:12]} does not descend from {base[:12]} (status {data.get('status')}), crawling everything")
+            return None
+        changed = data.get("files", [])
+        if len(changed) >= 300:
+            print(f"{len(changed)} or more files changed since {base[:12]}, crawling everything")
+            return None
+        return changed
+
+    def ingest_incremental(changed):
+        """
+        Bring previous_files up to date with the changed files of a comparison. Returns the
+        change list; files holds the merged result afterwards.
+        """
+        merged = dict(previous_files)
+        changes = {"added": [], "modified": [], "removed": []}
+        to_download = []
+        for item in changed:
+            item_path, status = item["filename"], item["status"]
+            # A rename removes the old path (and adds the new one below)
+            old_path = item.get("previous_filename") if status == "renamed" else None
+            for removed_path in filter(None, [old_path, item_path if status == "removed" else None]):
+                rel_path = relative_path(removed_path)
+                if rel_path is not None and merged.pop(rel_path, None) is not None:
+                    changes["removed"].append(rel_path)
+            if status == "removed":
+                continue
+            # The comparison carries no sizes: the size limit is applied to the download
+            rel_path = select_file(item_path, 0)
+            if rel_path is not None:
+                to_download.append((item_path, rel_path, {"sha": item["sha"], "size": 0}))
+
+        print(f"{len(changed)} files changed since {previous_commit[:12]}, {len(to_download)} to download")
+        for (item_path, rel_path, _), result in download_all(to_download):
+            if result is not None and result[0] == "file":
+                changes["modified" if rel_path in merged else "added"].append(rel_path)
+                merged[rel_path] = result[1]
+                continue
+            if result is not None:
+                skipped_files.append((item_path, result[1]))
+            # Too large or unavailable now: an outdated version must not be kept
+            if merged.pop(rel_path, None) is not None:
+                changes["removed"].append(rel_path)
+
+        # Same order as a full crawl, which lists files by path
+        files.update(sorted(merged.items()))
+        return changes
+
+    def ingest_archive():
+        """
+        Stream the tarball of the commit and keep the matching files, decoding them
+        straight from the stream: one download for the whole repository, nothing on disk.
+        """
+        url = f"https://api.github.com/repos/{owner}/{repo}/tarball/{commit_sha}"
+        nonlocal api_requests
+        archive_token = rate_limiter.acquire(tokens)
+        with session.get(url, headers=token_headers(archive_token), stream=True) as response:
+            with rate_lock:
+                api_requests += 1
+            rate_limiter.update(archive_token, response)
+            if response.status_code != 200:
+                print(f"Error downloading the archive of {owner}/{repo}: {response.status_code} - {response.text[:200]}")
+                return False
+            response.raw.decode_content = True
+            # "r|gz" reads the archive sequentially, without seeking
+            with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+                for member in archive:
+                    # Skip directories, symlinks and the like
+                    if not member.isfile():
                         continue
-                        
-                    if file_response.status_code == 200:
-                        files[rel_path] = file_response.text
-                        print(f"Downloaded: {rel_path} ({file_size} bytes) ")
-                    else:
-                        print(f"Failed to download {rel_path}: {file_response.status_code}")
-                else:
-                    # Alternative method if download_url is not available
-                    content_response = requests.get(item["url"], headers=headers)
-                    if content_response.status_code == 200:
-                        content_data = content_response.json()
-                        if content_data.get("encoding") == "base64" and "content" in content_data:
-                            # Check size of base64 content before decoding
-                            if len(content_data["content"]) * 0.75 > max_file_size:  # Approximate size calculation
-                                estimated_size = int(len(content_data["content"]) * 0.75)
-                                skipped_files.append((item_path, estimated_size))
-                                print(f"Skipping {rel_path}: Encoded content exceeds size limit")
-                                continue
-                                
-                            file_content = base64.b64decode(content_data["content"]).decode('utf-8')
-                            files[rel_path] = file_content
-                            print(f"Downloaded: {rel_path} ({file_size} bytes)")
-                        else:
-                            print(f"Unexpected content format for {rel_path}")
-                    else:
-                        print(f"Failed to get content for {rel_path}: {content_response.status_code}")
-            
-            elif item["type"] == "dir":
-                # Recursively process subdirectories
-                fetch_contents(item_path)
-    
-    # Start crawling from the specified path
-    fetch_contents(specific_path)
-    
+                    # Entries are prefixed with a "<owner>-<repo>-<sha>/" directory
+                    item_path = member.name.split("/", 1)[-1]
+                    rel_path = select_file(item_path, member.size)
+                    if rel_path is None:
+                        continue
+                    # Look at the first bytes before reading a binary file to the end
+                    extracted = archive.extractfile(member)
+                    head = extracted.read(BINARY_SNIFF_BYTES)
+                    if is_binary(head):
+                        print(f"Skipping {rel_path}: binary content")
+                        continue
+                    content = head + extracted.read()
+                    result = text_file(rel_path, content)
+                    if result is None:
+                        continue
+                    files[rel_path] = result[1]
+                    print(f"Extracted: {rel_path} ({member.size} bytes)")
+                    # Archive entries carry no SHA; store them under the computed one so
+                    # later tree-based crawls can reuse them
+                    if http_cache is not None:
+                        http_cache.put_blob(content)
+        return True
+
+    # Resolve the ref once so the listing and every download see the same commit
+    commit_sha = resolve_commit(ref)
+
+    # With an earlier crawl to start from, only the files changed since then are fetched
+    changed = None
+    if commit_sha and previous_commit and previous_files is not None:
+        changed = [] if previous_commit == commit_sha else compare_commits(previous_commit, commit_sha)
+
+    changes = None
+    if changed is not None:
+        changes = ingest_incremental(changed)
+    elif commit_sha and ingest == "archive":
+        print(f"Streaming the archive of {owner}/{repo} at {commit_sha[:12]}...")
+        ingest_archive()
+    elif commit_sha:
+        # List every file below the specified path, then filter on the tree metadata
+        # (path and size) before downloading anything
+        to_download = []
+        for item_path, entry in list_requested_path():
+            # Skip directories and submodules
+            if entry["type"] != "blob":
+                continue
+            rel_path = select_file(item_path, entry.get("size", 0))
+            if rel_path is not None:
+                to_download.append((item_path, rel_path, entry))
+
+        print(f"Listed {owner}/{repo} at {commit_sha[:12]} in {api_requests} API requests, "
+              f"{len(to_download)} files to download")
+
+        for (item_path, rel_path, _), result in download_all(to_download):
+            if result is None:
+                continue
+            kind, value = result
+            if kind == "file":
+                files[rel_path] = value
+            else:
+                skipped_files.append((item_path, value))
+
+    if changes is None and commit_sha and previous_files is not None:
+        changes = diff_manifests(previous_files, files)
+
     return {
         "files": files,
         "stats": {
@@ -326,7 +824,14 @@ def crawl_github_files(
             "skipped_files": skipped_files,
             "base_path": specific_path if use_relative_paths else None,
             "include_patterns": include_patterns,
-            "exclude_patterns": exclude_patterns
+            "exclude_patterns": exclude_patterns,
+            "commit_sha": commit_sha,
+            "api_requests": api_requests,
+            "cached_responses": cached_responses,
+            "reused_blobs": reused_blobs,
+            "rate_limit": rate_limiter.metrics(tokens),
+            "changes": changes,
+            "source": "compare" if changed is not None else "archive" if ingest == "archive" else "api"
         }
     }
 
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+
+# GitHub API budget, shared by every crawl in the process (override via environment variables).
+# Each token (and the anonymous client) has its own hourly quota; the X-RateLimit-* headers of
+# every response tell how much of it is left, so requests are paced before it runs out.
+GITHUB_TOKENS = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(",") if t.strip()]  # Extra tokens to rotate through
+RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "100"))  # Pace a token once this few requests are left
+MAX_RETRIES = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", "3"))  # Attempts after a rate limited response
+
+def limited_wait(response):
+    """If the response says the client is rate limited, return the seconds to wait, else None"""
+    limited = response.status_code == 429 or (
+        response.status_code == 403 and (
+            "rate limit" in response.text.lower() or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+    )
+    if not limited:
+        return None
+    if response.headers.get("Retry-After"):
+        return float(response.headers["Retry-After"])
+    reset_time = int(response.headers.get("X-RateLimit-Reset", 0))
+    return max(reset_time - time.time(), 0) + 1
+
+class _Budget:
+    """What is known about the quota of one token"""
+
+    def __init__(self):
+        self.limit = None  # Unknown until the first response
+        self.remaining = None
+        self.reset = 0.0
+        self.next_at = 0.0  # Earliest time of the next request while pacing
+        self.requests = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+    def ready_at(self, now: float, reserve: int) -> float:
+        """When the next request may be sent with this token"""
+        if self.remaining is None:
+            return now
+        if now >= self.reset:
+            # A new window has started (the next response will tell the exact numbers)
+            self.remaining = self.limit
+            self.next_at = 0.0
+        if self.remaining <= 0:
+            return self.reset
+        if self.remaining <= reserve:
+            return max(now, self.next_at)
+        return now
+
+class GitHubRateLimiter:
+    """
+    Paces GitHub API requests and rotates through a pool of tokens.
+
+    Tokens are used in the order given: a token is kept while it has more than `reserve`
+    requests left (so conditional requests keep hitting the same cache entries). Below the
+    reserve, the next token with budget to spare takes over; once every token is low, the
+    requests left are spread evenly until the quota resets, instead of using them up
+    and then stalling for up to an hour.
+
+    Args:
+        reserve (int): Requests left at which a token is paced
+    """
+
+    def __init__(self, reserve: int = RESERVE):
+        self.reserve = reserve
+        self._budgets = {}  # token (None = anonymous) -> _Budget
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens, spend: bool = True) -> str:
+        """
+        Block until one of the tokens may send a request, and return it (None = anonymous).
+        With spend False the request does not count against the API quota (raw file
+        downloads), but still waits for a token that is not rate limited.
+        """
+        tokens = list(tokens) or [None]
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                budgets = [(token, self._budgets.setdefault(token, _Budget())) for token in tokens]
+                ready = [(budget.ready_at(now, self.reserve), token, budget) for token, budget in budgets]
+                # The first token that is not being paced, otherwise the one available soonest
+                fresh = [item for item in ready if item[0] <= now and not self._low(item[2])]
+                at, token, budget = fresh[0] if fresh else min(ready, key=lambda item: item[0])
+                if at <= now:
+                    budget.requests += 1
+                    budget.waited += waited
+                    if spend and budget.remaining is not None:
+                        budget.remaining -= 1
+                        if self._low(budget):
+                            # Spread what is left of the window over the requests left
+                            budget.next_at = now + max(budget.reset - now, 0) / max(budget.remaining, 1)
+                    return token
+            delay = at - now
+            if delay > 60:
+                print(f"GitHub API budget exhausted, waiting {delay:.0f} seconds for it to reset...")
+            time.sleep(delay)
+            waited += delay
+
+    def _low(self, budget: _Budget) -> bool:
+        return budget.remaining is not None and budget.remaining <= self.reserve
+
+    def update(self, token: str, response):
+        """
+        Record the rate limit headers of a response sent with a token. Returns the seconds
+        to wait if the response was rate limited (the token is then set aside), else None.
+        """
+        wait = limited_wait(response)
+        headers = response.headers
+        with self._lock:
+            budget = self._budgets.setdefault(token, _Budget())
+            if headers.get("X-RateLimit-Remaining") is not None:
+                remaining = int(headers["X-RateLimit-Remaining"])
+                reset = float(headers.get("X-RateLimit-Reset", 0))
+                budget.limit = int(headers.get("X-RateLimit-Limit", remaining))
+                # Responses of concurrent requests arrive out of order: within a window,
+                # the lowest count is the most recent
+                if reset != budget.reset or budget.remaining is None:
+                    budget.remaining = remaining
+                else:
+                    budget.remaining = min(budget.remaining, remaining)
+                budget.reset = reset
+            if wait is not None:
+                budget.rate_limited += 1
+                budget.remaining = 0
+                budget.reset = max(budget.reset, time.time() + wait)
+                budget.limit = budget.limit or 0
+        return wait
+
+    def metrics(self, tokens=None) -> list:
+        """Remaining budget per token (all tokens seen, or the given ones), with tokens masked"""
+        now = time.time()
+        with self._lock:
+            items = [(t, self._budgets[t]) for t in (tokens if tokens is not None else self._budgets) if t in self._budgets]
+            return [
+                {
+                    "token": f"...{token[-4:]}" if token else "anonymous",
+                    "limit": budget.limit,
+                    "remaining": budget.remaining,
+                    "reset_in": max(0, round(budget.reset - now)) if budget.reset else None,
+                    "requests": budget.requests,
+                    "rate_limited": budget.rate_limited,
+                    "waited": round(budget.waited, 1),
+                }
+                for token, budget in items
+            ]
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_github_rate_limiter() -> GitHubRateLimiter:
+    """Return the process-wide GitHub rate limiter"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = GitHubRateLimiter()
+        return _limiter
+
+def token_pool(token: str = None) -> list:
+    """Tokens to rotate through: the given one first, then GITHUB_TOKENS (None = anonymous only)"""
+    tokens = [token] if token else []
+    tokens += [t for t in GITHUB_TOKENS if t not in tokens]
+    return tokens or [None]
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    from utils.llm_retry import get_retry_policy, call_with_retry
+except ImportError:  # Running from inside utils/
+    from llm_retry import get_retry_policy, call_with_retry
+
+# Batch mode: instead of one request per prompt, prompts from concurrently running flows are
+# collected and submitted as Gemini batch jobs (cheaper, higher throughput, but can take hours).
+#   LLM_BATCH_MODE=1         -> route call_llm through batch jobs (or main.py --batch)
+#   LLM_BATCH_MAX_SIZE       -> submit once this many prompts of one model are waiting (default: 500)
+#   LLM_BATCH_LINGER         -> or once the oldest waiting prompt is this many seconds old (default: 60)
+#   LLM_BATCH_POLL_INTERVAL  -> seconds between job status checks (default: 30)
+#   LLM_BATCH_TIMEOUT        -> give up on a job after this many seconds (default: 24 h)
+BATCH_MODE = os.getenv("LLM_BATCH_MODE", "").lower() in ("1", "true", "yes")
+BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "500"))
+BATCH_LINGER = float(os.getenv("LLM_BATCH_LINGER", "60"))
+BATCH_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "30"))
+BATCH_TIMEOUT = float(os.getenv("LLM_BATCH_TIMEOUT", str(24 * 3600)))
+
+TERMINAL_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+class BatchError(RuntimeError):
+    """A batch job, or one request inside it, failed"""
+
+class _Request:
+    def __init__(self, prompt: str, stage: str):
+        self.prompt = prompt
+        self.stage = stage
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+class BatchSubmitter:
+    """
+    Collects prompts and submits them as batch jobs, one job per client/model/parameters.
+
+    Flows taking part in a batch run register as participants. Queued prompts are
+    submitted as soon as every participant (or, with none registered, the caller) has
+    one queued (no flow can add more), when
+    a group reaches max_size, or after linger seconds. Flows whose prompts are already
+    in a running job are not waited for. Each job is polled in its own thread and its
+    responses are handed back to the waiting callers.
+
+    Args:
+        max_size (int): Maximum prompts per batch job
+        linger (float): Maximum seconds a prompt waits for others before its batch is submitted
+        poll_interval (float): Seconds between job status checks
+        timeout (float): Seconds after which a job that has not finished is treated as failed
+    """
+
+    def __init__(self, max_size: int = BATCH_MAX_SIZE, linger: float = BATCH_LINGER,
+                 poll_interval: float = BATCH_POLL_INTERVAL, timeout: float = BATCH_TIMEOUT):
+        self.max_size = max_size
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._groups = {}  # (client id, model, params json) -> (client, model, params, [_Request])
+        self._participants = 0
+        self._waiting = 0  # Queued prompts, i.e. callers blocked until the next submission
+        self._flusher = None
+        self.jobs_submitted = 0
+
+    def register(self):
+        """Declare a flow that will issue LLM calls through this submitter"""
+        with self._cond:
+            self._participants += 1
+
+    def unregister(self):
+        """The flow is done (or failed); stop waiting for its prompts"""
+        with self._cond:
+            self._participants -= 1
+            self._cond.notify_all()
+
+    def generate(self, client, model: str, params: dict, prompt: str, stage: str = None):
+        """Add a prompt to the next batch and block until its response is available"""
+        request = _Request(prompt, stage)
+        key = (id(client), model, json.dumps(params or {}, sort_keys=True))
+        with self._cond:
+            group = self._groups.setdefault(key, (client, model, params, []))
+            group[3].append(request)
+            self._waiting += 1
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="llm-batch-flush", daemon=True)
+                self._flusher.start()
+            self._cond.notify_all()
+        return request.future.result()
+
+    def _ready_groups(self):
+        """Pop the groups that should be submitted now (called with the lock held)"""
+        now = time.monotonic()
+        # Without registered flows, a caller has nobody to wait for either
+        all_blocked = self._waiting >= max(self._participants, 1)
+        ready = []
+        for key, (client, model, params, requests) in list(self._groups.items()):
+            oldest = min(r.queued_at for r in requests)
+            if all_blocked or len(requests) >= self.max_size or now - oldest >= self.linger:
+                del self._groups[key]
+                self._waiting -= len(requests)
+                for start in range(0, len(requests), self.max_size):
+                    ready.append((client, model, params, requests[start:start + self.max_size]))
+        return ready
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._groups:
+                    self._flusher = None
+                    return
+                ready = self._ready_groups()
+                if not ready:
+                    self._cond.wait(timeout=1.0)
+                    continue
+            for client, model, params, requests in ready:
+                threading.Thread(
+                    target=self._run_job, args=(client, model, params, requests), name="llm-batch-job", daemon=True
+                ).start()
+
+    def _run_job(self, client, model: str, params: dict, requests):
+        """Submit one batch job, poll it to completion and resolve its requests' futures"""
+        try:
+            policy = get_retry_policy("batch")
+            src = [
+                {"contents": [{"role": "user", "parts": [{"text": r.prompt}]}], **({"config": params} if params else {})}
+                for r in requests
+            ]
+            stages = sorted({r.stage or "default" for r in requests})
+            job = call_with_retry(
+                lambda: client.batches.create(
+                    model=model, src=src, config={"display_name": f"tutorial-{'-'.join(stages)}-{len(requests)}"}
+                ),
+                policy,
+            )
+            with self._cond:
+                self.jobs_submitted += 1
+            print(f"Submitted LLM batch job {job.name}: {len(requests)} prompts for {model} ({', '.join(stages)})")
+
+            deadline = time.monotonic() + self.timeout
+            state = str(getattr(job.state, "value", job.state))
+            while state not in TERMINAL_STATES:
+                if time.monotonic() > deadline:
+                    raise BatchError(f"Batch job {job.name} did not finish within {self.timeout:.0f}s")
+                time.sleep(self.poll_interval)
+                job = call_with_retry(lambda: client.batches.get(name=job.name), policy)
+                state = str(getattr(job.state, "value", job.state))
+
+            if state != "JOB_STATE_SUCCEEDED":
+                raise BatchError(f"Batch job {job.name} ended in state {state}: {getattr(job, 'error', None)}")
+            responses = (job.dest.inlined_responses if job.dest else None) or []
+            if len(responses) != len(requests):
+                raise BatchError(f"Batch job {job.name} returned {len(responses)} responses for {len(requests)} prompts")
+            print(f"LLM batch job {job.name} finished")
+            # Inline responses come back in request order
+            for request, item in zip(requests, responses):
+                if item.error is not None or item.response is None:
+                    request.future.set_exception(BatchError(f"Batch request failed: {item.error}"))
+                else:
+                    request.future.set_result(item.response)
+        except Exception as e:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+class batch_participant:
+    """Context manager registering the current flow with the batch submitter"""
+
+    def __enter__(self):
+        get_batcher().register()
+        return self
+
+    def __exit__(self, *exc):
+        get_batcher().unregister()
+        return False
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher() -> BatchSubmitter:
+    """Return the process-wide batch submitter"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = BatchSubmitter()
+        return _batcher
+
+def set_batch_mode(enabled: bool):
+    """Turn batch mode on or off for this process"""
+    global BATCH_MODE
+    BATCH_MODE = enabled
+
+def batch_mode_enabled() -> bool:
+    return BATCH_MODE
@@ -0,0 +1,674 @@
+import sqlite3
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import zstandard  # Optional: pip install zstandard for LLM_CACHE_CODEC=zstd
+except ImportError:
+    zstandard = None
+
+# Cache configuration (override via environment variables)
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+DEFAULT_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", "0"))  # 0 = unlimited
+DEFAULT_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "0"))  # 0 = never expire
+DEFAULT_LEASE_TTL = float(os.getenv("LLM_INFLIGHT_TTL", "900"))  # Seconds before an in-flight claim is considered dead
+DEFAULT_CODEC = os.getenv("LLM_CACHE_CODEC", "zlib")  # zlib, zstd (needs zstandard) or none
+COMPRESS_MIN_BYTES = 256  # Shorter responses are stored as plain text
+EVICT_TO = 0.9  # Size eviction frees space down to this fraction of max_bytes
+FLUSH_INTERVAL = 5.0  # Seconds between writes of the buffered hit counters and access times
+# Cache packs (see export_pack) merged into the cache when this process first opens it, separated by os.pathsep
+DEFAULT_PACKS = os.getenv("LLM_CACHE_PACKS", "")
+PACK_FORMAT = "llm-cache-pack"
+PACK_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,            -- Plain text, or a compressed BLOB (see codec)
+    size INTEGER NOT NULL,             -- Stored bytes
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    namespace TEXT NOT NULL DEFAULT '',
+    codec TEXT NOT NULL DEFAULT 'none',
+    raw_size INTEGER,                  -- Uncompressed UTF-8 bytes
+    hits INTEGER NOT NULL DEFAULT 0,
+    project TEXT NOT NULL DEFAULT ''    -- Project (repository) the response was generated for
+);
+CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses(created_at);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses(accessed_at);
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_sizes (
+    name TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL             -- Running total of responses.size, kept by the triggers below
+);
+"""
+
+# Keep the total size of the responses up to date, so the size cap never needs a scan
+SIZE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses BEGIN
+        UPDATE table_sizes SET bytes = bytes + NEW.size WHERE name = 'responses';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses BEGIN
+        UPDATE table_sizes SET bytes = bytes - OLD.size WHERE name = 'responses';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses BEGIN
+        UPDATE table_sizes SET bytes = bytes + NEW.size - OLD.size WHERE name = 'responses';
+    END""",
+)
+
+# Columns added after the first release of the cache, with their definitions for ALTER TABLE
+MIGRATIONS = {
+    "namespace": "TEXT NOT NULL DEFAULT ''",
+    "codec": "TEXT NOT NULL DEFAULT 'none'",
+    "raw_size": "INTEGER",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+    "project": "TEXT NOT NULL DEFAULT ''",
+}
+
+def prompt_key(prompt: str, namespace: str = "") -> str:
+    """
+    Return the cache key for a prompt (sha256 hex digest).
+    The namespace (provider/model/parameters) keeps responses from different models apart.
+    """
+    if namespace:
+        prompt = f"{namespace}\n{prompt}"
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def encode_response(response: str, codec: str = DEFAULT_CODEC):
+    """
+    Compress a response for storage.
+    Returns (payload, codec actually used, raw size, stored size).
+    """
+    raw = response.encode("utf-8")
+    if codec == "zstd" and zstandard is None:
+        codec = "zlib"
+    if codec != "none" and len(raw) >= COMPRESS_MIN_BYTES:
+        if codec == "zstd":
+            payload = zstandard.ZstdCompressor(level=10).compress(raw)
+        else:
+            codec, payload = "zlib", zlib.compress(raw, 6)
+        if len(payload) < len(raw):
+            return payload, codec, len(raw), len(payload)
+    return response, "none", len(raw), len(raw)
+
+def decode_response(payload, codec: str) -> str:
+    """Inverse of encode_response"""
+    if codec == "zlib":
+        return zlib.decompress(payload).decode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Cache entry is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    return payload
+
+class LLMCache:
+    """
+    SQLite-backed LLM response cache.
+
+    The database runs in WAL mode so readers never block writers and several
+    processes can share one cache file. Each thread gets its own connection,
+    and connections are re-opened after a fork. Responses are stored compressed
+    (zlib by default) and tagged with their namespace for the stats report.
+
+    Args:
+        path (str): Path of the SQLite database file
+        max_bytes (int, optional): Evict least recently used entries once the total
+                                   response size exceeds this many bytes (0 = unlimited)
+        max_age_days (float, optional): Evict entries older than this many days (0 = never)
+        codec (str, optional): Compression for new entries: "zlib", "zstd" or "none"
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS, codec: str = DEFAULT_CODEC):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.codec = codec
+        self._local = threading.local()
+        # Hits and access times are buffered and written in one transaction every
+        # FLUSH_INTERVAL seconds, so cache reads do not compete for the write lock
+        self._pending_lock = threading.Lock()
+        self._pending_counts = {}
+        self._pending_hits = {}  # key -> [accessed_at, hits]
+        self._last_flush = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        atexit.register(self.flush)
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Add columns missing from caches created by older versions"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+        missing = [name for name in MIGRATIONS if name not in columns]
+        if missing:
+            with self._transaction() as tx:
+                columns = {row[1] for row in tx.execute("PRAGMA table_info(responses)")}
+                for name in missing:
+                    if name not in columns:
+                        tx.execute(f"ALTER TABLE responses ADD COLUMN {name} {MIGRATIONS[name]}")
+                tx.execute("UPDATE responses SET raw_size = size WHERE raw_size IS NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_namespace ON responses(namespace)")
+        if conn.execute("SELECT 1 FROM table_sizes WHERE name = 'responses'").fetchone() is None:
+            # Caches created before the running total: compute it once, together with the triggers
+            with self._transaction() as tx:
+                if tx.execute("SELECT 1 FROM table_sizes WHERE name = 'responses'").fetchone() is None:
+                    tx.execute("INSERT INTO table_sizes (name, bytes) SELECT 'responses', COALESCE(SUM(size), 0) FROM responses")
+                for trigger in SIZE_TRIGGERS:
+                    tx.execute(trigger)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the connection for the current thread/process, opening it if needed"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        # isolation_level=None: we manage transactions explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction, taking the write lock up front"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, prompt: str, namespace: str = "") -> Optional[str]:
+        """Return the cached response for a prompt, or None on a miss"""
+        return self._lookup(prompt_key(prompt, namespace))
+
+    def _lookup(self, key: str, count: bool = True) -> Optional[str]:
+        conn = self._connect()
+        row = conn.execute("SELECT response, codec FROM responses WHERE key = ?", (key,)).fetchone()
+        response = decode_response(*row) if row is not None else None
+        # Touch the entry for LRU eviction and count the lookup for the stats report
+        # (buffered, see flush)
+        with self._pending_lock:
+            if response is not None:
+                pending = self._pending_hits.setdefault(key, [0.0, 0])
+                pending[0] = time.time()
+                pending[1] += int(count)
+            if count:
+                name = "hits" if response is not None else "misses"
+                self._pending_counts[name] = self._pending_counts.get(name, 0) + 1
+        self.flush(force=False)
+        return response
+
+    def flush(self, force: bool = True):
+        """Write the buffered hit counters and access times (at most every FLUSH_INTERVAL seconds unless forced)"""
+        with self._pending_lock:
+            if not force and time.monotonic() - self._last_flush < FLUSH_INTERVAL:
+                return
+            counts, self._pending_counts = self._pending_counts, {}
+            hits, self._pending_hits = self._pending_hits, {}
+            self._last_flush = time.monotonic()
+        if not counts and not hits:
+            return
+        # A failure here must not fail a lookup; the counts are only statistics
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    counts.items(),
+                )
+                conn.executemany(
+                    "UPDATE responses SET accessed_at = MAX(accessed_at, ?), hits = hits + ? WHERE key = ?",
+                    [(accessed_at, count, key) for key, (accessed_at, count) in hits.items()],
+                )
+        except sqlite3.Error:
+            pass
+
+    def set(self, prompt: str, response: str, namespace: str = "", project: str = "") -> None:
+        """Store a response atomically, then apply the eviction policy"""
+        now = time.time()
+        payload, codec, raw_size, size = encode_response(response, self.codec)
+        # An upsert rather than INSERT OR REPLACE: the replaced row's delete would not fire the size trigger
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO responses "
+                "(key, response, size, created_at, accessed_at, namespace, codec, raw_size, project) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET response = excluded.response, size = excluded.size, "
+                "created_at = excluded.created_at, accessed_at = excluded.accessed_at, "
+                "namespace = excluded.namespace, codec = excluded.codec, raw_size = excluded.raw_size, "
+                "project = excluded.project",
+                (prompt_key(prompt, namespace), payload, size, now, now, namespace, codec, raw_size, project),
+            )
+            self._evict(conn)
+
+    def acquire_lease(self, prompt: str, namespace: str = "", ttl: float = DEFAULT_LEASE_TTL) -> bool:
+        """
+        Claim the right to generate a prompt's response. Returns False while another
+        process holds an unexpired claim; the claim lets concurrent workers wait for
+        one API call instead of each paying for the same prompt.
+        """
+        key = prompt_key(prompt, namespace)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at < ?", (key, now))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, str(os.getpid()), now + ttl),
+            ).rowcount
+        return inserted == 1
+
+    def renew_lease(self, prompt: str, namespace: str = "", ttl: float = DEFAULT_LEASE_TTL) -> bool:
+        """Extend this process's claim on a prompt (e.g. while a batch job runs). Returns False if it no longer holds it."""
+        with self._transaction() as conn:
+            renewed = conn.execute(
+                "UPDATE inflight SET expires_at = ? WHERE key = ? AND owner = ?",
+                (time.time() + ttl, prompt_key(prompt, namespace), str(os.getpid())),
+            ).rowcount
+        return renewed == 1
+
+    def release_lease(self, prompt: str, namespace: str = "") -> None:
+        """Give up a claim taken with acquire_lease (after storing the response, or on failure)"""
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM inflight WHERE key = ? AND owner = ?", (prompt_key(prompt, namespace), str(os.getpid()))
+            )
+
+    def wait_for(self, prompt: str, namespace: str = "", poll_interval: float = 0.5) -> Optional[str]:
+        """
+        Wait while another process holds the claim for a prompt.
+        Returns its response once cached, or None if the claim ended without one.
+        """
+        key = prompt_key(prompt, namespace)
+        conn = self._connect()
+        while True:
+            response = self._lookup(key, count=False)
+            if response is not None:
+                return response
+            row = conn.execute("SELECT expires_at FROM inflight WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] < time.time():
+                # Claim released or expired; it may have stored the response just before releasing
+                return self._lookup(key, count=False)
+            time.sleep(poll_interval)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Delete expired entries, then least recently used ones until under max_bytes"""
+        removed = 0
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+
+        if self.max_bytes:
+            total = conn.execute("SELECT bytes FROM table_sizes WHERE name = 'responses'").fetchone()[0]
+            if total > self.max_bytes:
+                # Free some headroom so the next inserts do not each evict again
+                excess = total - int(self.max_bytes * EVICT_TO)
+                freed = 0
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                    if freed >= excess:
+                        break
+                    victims.append((key,))
+                    freed += size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                removed += len(victims)
+        return removed
+
+    def evict(self) -> int:
+        """Apply the eviction policy now. Returns the number of entries removed."""
+        with self._transaction() as conn:
+            return self._evict(conn)
+
+    def import_json(self, json_path: str, namespace="") -> int:
+        """
+        One-shot import of a legacy llm_cache.json ({prompt: response}) file.
+        Pass the namespace call_llm looks the entries up in, or a function mapping a prompt
+        to its namespaces (e.g. the namespace of the stage that issued it).
+        Existing entries are kept. Returns the number of entries imported.
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        namespaces_for = namespace if callable(namespace) else (lambda prompt: [namespace])
+        now = time.time()
+        rows = []
+        for prompt, response in legacy.items():
+            if isinstance(response, str):
+                payload, codec, raw_size, size = encode_response(response, self.codec)
+                for ns in namespaces_for(prompt):
+                    rows.append((prompt_key(prompt, ns), payload, size, now, now, ns, codec, raw_size))
+        with self._transaction() as conn:
+            # rowcount, not total_changes: the latter also counts the size trigger's updates
+            imported = conn.executemany(
+                "INSERT OR IGNORE INTO responses "
+                "(key, response, size, created_at, accessed_at, namespace, codec, raw_size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            ).rowcount
+            self._evict(conn)
+        return imported
+
+    def export_pack(self, pack_path: str, projects=None, namespaces=None, since: float = None,
+                    until: float = None) -> int:
+        """
+        Write cache entries to a pack file for warming other machines' caches.
+
+        A pack is gzip-compressed JSON lines: a header line, then one entry per line
+        with its key, namespace, project, creation time and response text. Prompts are
+        not included (keys are prompt hashes), so a pack merges into any cache.
+
+        Args:
+            pack_path (str): Pack file to write (conventionally *.llmpack)
+            projects (list, optional): Only export entries generated for these projects
+            namespaces (list, optional): Only export entries of these provider/model namespaces
+            since (float), until (float): Only export entries created in [since, until) (unix time)
+
+        Returns:
+            int: Number of entries exported
+        """
+        where, params = [], []
+        if projects:
+            where.append(f"project IN ({','.join('?' * len(projects))})")
+            params.extend(projects)
+        if namespaces:
+            where.append(f"namespace IN ({','.join('?' * len(namespaces))})")
+            params.extend(namespaces)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        query = "SELECT key, namespace, project, created_at, response, codec FROM responses"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+
+        directory = os.path.dirname(os.path.abspath(pack_path))
+        os.makedirs(directory, exist_ok=True)
+        exported = 0
+        tmp_path = f"{pack_path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            header = {"format": PACK_FORMAT, "version": PACK_VERSION, "created_at": time.time(),
+                      "filters": {"projects": projects, "namespaces": namespaces, "since": since, "until": until}}
+            f.write(json.dumps(header) + "\n")
+            for key, namespace, project, created_at, payload, codec in self._connect().execute(query, params):
+                entry = {"key": key, "namespace": namespace, "project": project, "created_at": created_at,
+                         "response": decode_response(payload, codec)}
+                f.write(json.dumps(entry) + "\n")
+                exported += 1
+        os.replace(tmp_path, pack_path)  # Never leave a half-written pack behind
+        return exported
+
+    def import_pack(self, pack_path: str, batch_size: int = 500):
+        """
+        Merge a pack written by export_pack into this cache. Entries already present are
+        kept as they are, so importing the same pack twice changes nothing.
+
+        Returns:
+            tuple: (entries added, entries already present)
+        """
+        added = skipped = 0
+
+        def flush(rows):
+            nonlocal added, skipped
+            with self._transaction() as conn:
+                inserted = conn.executemany(
+                    "INSERT OR IGNORE INTO responses "
+                    "(key, response, size, created_at, accessed_at, namespace, codec, raw_size, project) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                ).rowcount
+            added += inserted
+            skipped += len(rows) - inserted
+
+        now = time.time()
+        rows = []
+        with gzip.open(pack_path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != PACK_FORMAT or header.get("version", 0) > PACK_VERSION:
+                raise ValueError(f"{pack_path} is not a supported LLM cache pack")
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                payload, codec, raw_size, size = encode_response(entry["response"], self.codec)
+                rows.append((entry["key"], payload, size, entry.get("created_at", now), now,
+                             entry.get("namespace", ""), codec, raw_size, entry.get("project", "")))
+                if len(rows) >= batch_size:
+                    flush(rows)
+                    rows = []
+        if rows:
+            flush(rows)
+        if added:
+            self.evict()
+        return added, skipped
+
+    def compress(self, batch_size: int = 500) -> int:
+        """
+        Re-encode entries stored uncompressed (e.g. by older versions) with this cache's
+        codec, then VACUUM to return the freed pages to disk. Returns the number of entries compressed.
+        """
+        compressed = 0
+        last_key = ""
+        while True:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT key, response FROM responses WHERE codec = 'none' AND key > ? ORDER BY key LIMIT ?",
+                (last_key, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            last_key = rows[-1][0]
+            updates = []
+            for key, response in rows:
+                payload, codec, raw_size, size = encode_response(response, self.codec)
+                if codec != "none":
+                    updates.append((payload, codec, raw_size, size, key))
+            with self._transaction() as tx:
+                tx.executemany(
+                    "UPDATE responses SET response = ?, codec = ?, raw_size = ?, size = ? WHERE key = ? AND codec = 'none'",
+                    updates,
+                )
+            compressed += len(updates)
+        if compressed:
+            self._connect().execute("VACUUM")
+        return compressed
+
+    def stats(self, top: int = 10) -> dict:
+        """
+        Summarize the cache for sizing: entry counts, bytes stored vs. uncompressed,
+        lookup hit rate (since the counters were created or last reset), usage per
+        namespace and the largest entries.
+        """
+        self.flush()
+        conn = self._connect()
+        entries, raw_bytes, stored_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        namespaces = [
+            {"namespace": namespace, "entries": count, "raw_bytes": raw, "stored_bytes": stored, "hits": ns_hits}
+            for namespace, count, raw, stored, ns_hits in conn.execute(
+                "SELECT namespace, COUNT(*), SUM(raw_size), SUM(size), SUM(hits) FROM responses "
+                "GROUP BY namespace ORDER BY SUM(size) DESC"
+            )
+        ]
+        top_entries = [
+            {"key": key, "namespace": namespace, "raw_bytes": raw, "stored_bytes": stored, "codec": codec,
+             "hits": entry_hits, "created_at": created_at, "accessed_at": accessed_at}
+            for key, namespace, raw, stored, codec, entry_hits, created_at, accessed_at in conn.execute(
+                "SELECT key, namespace, raw_size, size, codec, hits, created_at, accessed_at FROM responses "
+                "ORDER BY size DESC LIMIT ?", (top,)
+            )
+        ]
+        return {
+            "path": self.path,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "entries": entries,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "bytes_saved": raw_bytes - stored_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+            "namespaces": namespaces,
+            "top_entries": top_entries,
+        }
+
+    def reset_stats(self) -> None:
+        """Reset the hit/miss counters"""
+        self.flush()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM counters")
+            conn.execute("UPDATE responses SET hits = 0")
+
+def format_stats(stats: dict) -> str:
+    """Human-readable report for LLMCache.stats()"""
+    def human(n):
+        n = n or 0
+        for unit in ("B", "KB", "MB"):
+            if n < 1024:
+                return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+            n /= 1024
+        return f"{n:.1f} GB"
+    hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "n/a"
+    lines = [
+        f"Cache {stats['path']} ({human(stats['file_bytes'])} on disk)",
+        f"  entries: {stats['entries']} | stored: {human(stats['stored_bytes'])} | uncompressed: "
+        f"{human(stats['raw_bytes'])} | saved: {human(stats['bytes_saved'])}",
+        f"  lookups: {stats['hits']} hits, {stats['misses']} misses | hit rate: {hit_rate}",
+        "  by namespace:",
+    ]
+    for ns in stats["namespaces"]:
+        lines.append(f"    {ns['namespace'] or '(none)'}: {ns['entries']} entries, {human(ns['stored_bytes'])} "
+                     f"stored, {ns['hits']} hits")
+    lines.append("  largest entries:")
+    for entry in stats["top_entries"]:
+        lines.append(f"    {entry['key'][:16]} {human(entry['stored_bytes'])} ({human(entry['raw_bytes'])} raw, "
+                     f"{entry['codec']}) {entry['hits']} hits {entry['namespace'] or '(none)'}")
+    return "\n".join(lines)
+
+# Process-wide cache instances, one per database path
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(path: str = DEFAULT_CACHE_PATH) -> LLMCache:
+    """
+    Return the shared LLMCache for a database path.
+    The first time a path is opened, packs listed in LLM_CACHE_PACKS are merged into it.
+    """
+    with _caches_lock:
+        if path not in _caches:
+            cache = LLMCache(path)
+            for pack_path in filter(None, DEFAULT_PACKS.split(os.pathsep)):
+                try:
+                    cache.import_pack(pack_path)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping LLM cache pack {pack_path}: {e}")
+            _caches[path] = cache
+        return _caches[path]
+
+# Opening words of each stage's prompt in nodes.py, to tell which stage a legacy entry came from
+LEGACY_STAGE_MARKERS = {
+    "IdentifyAbstractions": "For the project `",
+    "AnalyzeRelationships": "Based on the following abstractions and relevant code snippets",
+    "OrderChapters": "Given the following project abstractions and their relationships",
+    "WriteChapters": "Write a very beginner-friendly tutorial chapter",
+}
+
+def legacy_namespaces(prompt: str) -> list:
+    """
+    Namespaces to import a legacy (pre-routing) cache entry under: the one of the stage
+    whose prompt it is, or every stage's if the prompt is not recognized
+    """
+    try:
+        from utils.llm_routing import get_route, route_namespace
+    except ImportError:
+        from llm_routing import get_route, route_namespace
+    stages = [stage for stage, marker in LEGACY_STAGE_MARKERS.items() if marker in prompt[:1000]]
+    return sorted({route_namespace(get_route(stage)) for stage in stages[:1] or LEGACY_STAGE_MARKERS})
+
+def parse_time(value: str) -> float:
+    """Parse a CLI date: YYYY-MM-DD (or any ISO datetime) or a relative age such as 7d or 12h"""
+    units = {"d": 86400, "h": 3600, "m": 60}
+    if value and value[-1] in units and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    from datetime import datetime
+    return datetime.fromisoformat(value).timestamp()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the SQLite LLM response cache.")
+    parser.add_argument("--db", default=DEFAULT_CACHE_PATH, help=f"Cache database path (default: {DEFAULT_CACHE_PATH}).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import a legacy llm_cache.json file.")
+    import_parser.add_argument("json_path", nargs="?", default="llm_cache.json")
+    import_parser.add_argument("--namespace", default=None,
+                               help="Cache namespace to import into (default: the namespace of each prompt's stage).")
+    subparsers.add_parser("evict", help="Apply the size/age eviction policy now.")
+    subparsers.add_parser("compress", help="Compress entries stored by older versions and reclaim disk space.")
+    export_parser = subparsers.add_parser("export", help="Export entries to a pack file for warming other caches.")
+    export_parser.add_argument("pack_path", help="Pack file to write, e.g. llm_cache.llmpack")
+    export_parser.add_argument("--project", action="append", help="Only entries of this project (repeatable).")
+    export_parser.add_argument("--namespace", action="append", help="Only entries of this namespace (repeatable).")
+    export_parser.add_argument("--since", help="Only entries created since this date (YYYY-MM-DD) or age (e.g. 7d).")
+    export_parser.add_argument("--until", help="Only entries created before this date (YYYY-MM-DD) or age.")
+    merge_parser = subparsers.add_parser("merge", help="Merge pack files into the cache (idempotent).")
+    merge_parser.add_argument("pack_paths", nargs="+")
+    stats_parser = subparsers.add_parser("stats", help="Show hit rate, bytes saved and the largest entries.")
+    stats_parser.add_argument("--top", type=int, default=10, help="Number of largest entries to list (default: 10).")
+    stats_parser.add_argument("--json", action="store_true", help="Print the stats as JSON.")
+    stats_parser.add_argument("--reset", action="store_true", help="Reset the hit/miss counters after printing.")
+    args = parser.parse_args()
+
+    cache = LLMCache(args.db)
+    if args.command == "import":
+        namespace = args.namespace if args.namespace is not None else legacy_namespaces
+        imported = cache.import_json(args.json_path, namespace)
+        print(f"Imported {imported} entries from {args.json_path} into {args.db} "
+              f"({'namespace ' + args.namespace if args.namespace is not None else 'per-stage namespaces'})")
+    elif args.command == "evict":
+        print(f"Evicted {cache.evict()} entries from {args.db}")
+    elif args.command == "export":
+        count = cache.export_pack(
+            args.pack_path, projects=args.project, namespaces=args.namespace,
+            since=parse_time(args.since) if args.since else None,
+            until=parse_time(args.until) if args.until else None,
+        )
+        print(f"Exported {count} entries from {args.db} to {args.pack_path} ({os.path.getsize(args.pack_path)} bytes)")
+    elif args.command == "merge":
+        for pack_path in args.pack_paths:
+            added, skipped = cache.import_pack(pack_path)
+            print(f"Merged {pack_path} into {args.db}: {added} added, {skipped} already present")
+    elif args.command == "compress":
+        print(f"Compressed {cache.compress()} entries in {args.db}")
+    elif args.command == "stats":
+        stats = cache.stats(args.top)
+        print(json.dumps(stats, indent=2) if args.json else format_stats(stats))
+        if args.reset:
+            cache.reset_stats()
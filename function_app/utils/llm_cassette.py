@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+
+# Cassette configuration:
+#   LLM_CASSETTE_MODE=record  -> call the real API and append every prompt/response pair to the cassette
+#   LLM_CASSETTE_MODE=replay  -> serve responses from the cassette only, never touching the network
+CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "").lower()
+CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "llm_cassette.jsonl")
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a prompt was never recorded"""
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+class Cassette:
+    """
+    Recorded prompt -> response pairs stored as JSON lines.
+
+    Each line holds {"namespace", "model", "prompt_hash", "prompt_size", "response"}.
+    Prompts themselves are not stored, only their hash, so cassettes stay small and
+    do not contain the crawled source code.
+
+    Args:
+        path (str): Path of the .jsonl cassette file
+        mode (str): "record" or "replay"
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = "replay"):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._by_namespace = {}  # (namespace, prompt_hash) -> response
+        self._by_model = {}      # (model, prompt_hash) -> response
+        self._by_hash = {}       # prompt_hash -> response
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry: dict):
+        self._by_namespace[(entry.get("namespace", ""), entry["prompt_hash"])] = entry["response"]
+        self._by_model[(entry.get("model", ""), entry["prompt_hash"])] = entry["response"]
+        self._by_hash[entry["prompt_hash"]] = entry["response"]
+
+    def __len__(self):
+        return len(self._by_namespace)
+
+    def record(self, prompt: str, response: str, namespace: str = "", model: str = ""):
+        """Append a prompt/response pair to the cassette"""
+        entry = {
+            "namespace": namespace,
+            "model": model,
+            "prompt_hash": prompt_hash(prompt),
+            "prompt_size": len(prompt),
+            "response": response,
+        }
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._index(entry)
+
+    def replay(self, prompt: str, namespace: str = "") -> str:
+        """Return the recorded response for a prompt; raises CassetteMiss if it was never recorded"""
+        key = (namespace, prompt_hash(prompt))
+        if key not in self._by_namespace:
+            raise CassetteMiss(f"No recorded response for prompt {key[1][:12]} (namespace {namespace}) in {self.path}")
+        return self._by_namespace[key]
+
+    def lookup(self, prompt: str, model: str = None):
+        """Best-effort lookup by model and prompt (used by the mock server). Returns None on a miss."""
+        digest = prompt_hash(prompt)
+        if model and (model, digest) in self._by_model:
+            return self._by_model[(model, digest)]
+        return self._by_hash.get(digest)
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def get_cassette():
+    """Return the process-wide cassette if LLM_CASSETTE_MODE is set, otherwise None"""
+    global _cassette
+    if CASSETTE_MODE not in ("record", "replay"):
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE_PATH, CASSETTE_MODE)
+        return _cassette
@@ -0,0 +1,108 @@
+import atexit
+import gzip
+import hashlib
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from datetime import datetime
+
+# Logging configuration (override via environment variables)
+#   LLM_LOG_MODE=summary -> one line per call: prompt hash, sizes, token counts, timing (default)
+#   LLM_LOG_MODE=full    -> additionally log the full prompt and response text
+#   LLM_LOG_MODE=off     -> only warnings and errors
+LOG_MODE = os.getenv("LLM_LOG_MODE", "summary").lower()
+LOG_LEVEL = os.getenv("LLM_LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LLM_LOG_MAX_BYTES", str(50 * 1024 * 1024)))  # Rotate after 50 MB
+LOG_BACKUP_COUNT = int(os.getenv("LLM_LOG_BACKUP_COUNT", "5"))  # Keep 5 compressed backups
+
+_listener = None
+_log_directory = None
+
+def _gzip_rotator(source: str, dest: str):
+    """Compress a rotated log file"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def setup_llm_logger(log_directory: str) -> logging.Logger:
+    """
+    Configure the "llm_logger" to write through a background thread.
+
+    Callers only enqueue records (QueueHandler); a QueueListener thread does the
+    disk I/O into a size-rotated log file whose backups are gzip-compressed.
+    """
+    global _listener, _log_directory
+
+    first_setup = _log_directory is None
+    _log_directory = log_directory
+    os.makedirs(log_directory, exist_ok=True)
+    log_file = os.path.join(log_directory, f"llm_calls_{datetime.now().strftime('%Y%m%d')}.log")
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger("llm_logger")
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False  # Prevent propagation to root logger
+    logger.handlers.clear()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+
+    if first_setup:
+        atexit.register(stop_llm_logger)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+    return logger
+
+def _restart_after_fork():
+    """A forked child has no listener thread; give it its own queue and writer"""
+    global _listener
+    _listener = None
+    setup_llm_logger(_log_directory)
+
+def stop_llm_logger():
+    """Flush pending records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def log_prompt(logger: logging.Logger, stage: str, model: str, prompt: str):
+    """Log the prompt text before the call (full mode only)"""
+    if LOG_MODE == "full":
+        logger.info(f"PROMPT ({stage or 'default'} -> {model}): {prompt}")
+
+def log_response(logger: logging.Logger, stage: str, model: str, prompt: str, response_text: str,
+                 seconds: float, source: str, response=None):
+    """
+    Log a completed call: a summary line (unless off) and the response text (full mode).
+
+    Args:
+        source (str): Where the response came from: "api", "batch", "cache", "replay" or "dedup"
+        response: The API response, if any, for the reported token counts
+    """
+    if LOG_MODE == "full":
+        logger.info(f"RESPONSE: {response_text}")
+    if LOG_MODE == "off":
+        return
+
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    logger.info(
+        f"CALL stage={stage or 'default'} model={model} source={source} "
+        f"prompt_sha={hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]} "
+        f"prompt_chars={len(prompt)} response_chars={len(response_text or '')} "
+        f"prompt_tokens={prompt_tokens} response_tokens={response_tokens} seconds={seconds:.2f}"
+    )
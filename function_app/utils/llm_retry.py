@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+# Error classes
+RETRYABLE = "retryable"        # Transient server or network failure: back off and try again
+RATE_LIMITED = "rate_limited"  # Quota exhausted (429): wait longer, honoring Retry-After
+FATAL = "fatal"                # Bad key, invalid or oversized prompt, ...: retrying cannot help
+
+RETRYABLE_STATUS = {408, 500, 502, 503, 504}
+RATE_LIMITED_STATUS = {429}
+
+# Retry policy per node class in nodes.py (same keys as the routing table in utils/llm_routing.py)
+#   max_attempts: total attempts per call, including the first one
+#   base_delay, max_delay: exponential backoff base*2^n, capped at max_delay seconds
+#   max_elapsed: stop retrying once a call has spent this many seconds in total
+DEFAULT_RETRY_POLICY = {"max_attempts": 5, "base_delay": 2.0, "max_delay": 60.0, "max_elapsed": 300.0}
+RETRY_POLICIES = {
+    "IdentifyAbstractions": {},
+    "AnalyzeRelationships": {"max_delay": 30.0},
+    "OrderChapters": {"max_delay": 30.0},
+    "WriteChapters": {"max_attempts": 6},
+}
+
+# Optional overrides, e.g. LLM_RETRY_POLICIES='{"WriteChapters": {"max_attempts": 8}}'
+# ("default" applies to calls without a stage)
+_overrides = json.loads(os.getenv("LLM_RETRY_POLICIES", "{}"))
+
+def _transport_errors():
+    """Connection/timeout exception types of the HTTP libraries the SDKs use"""
+    errors = [ConnectionError, TimeoutError]
+    try:
+        import httpx
+        errors.append(httpx.TransportError)
+    except ImportError:
+        pass
+    try:
+        import requests
+        errors.extend([requests.exceptions.ConnectionError, requests.exceptions.Timeout])
+    except ImportError:
+        pass
+    return tuple(errors)
+
+TRANSPORT_ERRORS = _transport_errors()
+
+def _status_code(exc: Exception):
+    """HTTP status of an SDK error (google-genai APIError.code, anthropic/openai status_code)"""
+    response = getattr(exc, "response", None)
+    for status in (getattr(response, "status_code", None), getattr(exc, "status_code", None), getattr(exc, "code", None)):
+        if isinstance(status, int) and 100 <= status < 600:
+            return status
+    return None
+
+def retry_after_seconds(exc: Exception):
+    """
+    Server-requested wait from a Retry-After header (seconds or HTTP date) or, for
+    Gemini, the RetryInfo "retryDelay" in the error details. Returns None if absent.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []) or []:
+            if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("RetryInfo"):
+                match = re.match(r"([\d.]+)s", str(detail.get("retryDelay", "")))
+                if match:
+                    return float(match.group(1))
+    return None
+
+def classify_error(exc: Exception) -> str:
+    """Classify an exception from an LLM call as RETRYABLE, RATE_LIMITED or FATAL"""
+    status = _status_code(exc)
+    if status in RATE_LIMITED_STATUS:
+        return RATE_LIMITED
+    if status in RETRYABLE_STATUS:
+        return RETRYABLE
+    if status is not None:
+        return FATAL
+    if isinstance(exc, TRANSPORT_ERRORS):
+        return RETRYABLE
+    return FATAL
+
+class RetryPolicy:
+    """
+    Capped exponential backoff with jitter.
+
+    Transient errors wait a random time up to the capped backoff ("full jitter"), so
+    workers that failed together do not retry together. Rate-limit errors wait at least
+    half the backoff, or the Retry-After requested by the server plus a little jitter.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 60.0,
+                 max_elapsed: float = 300.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+    def backoff(self, attempt: int, kind: str, retry_after: float = None) -> float:
+        """Seconds to wait before retry number `attempt` (0 for the first retry)"""
+        cap = min(self.max_delay, self.base_delay * 2 ** attempt)
+        if kind == RATE_LIMITED:
+            delay = cap / 2 + random.uniform(0, cap / 2)
+            if retry_after is not None:
+                delay = retry_after + random.uniform(0, max(1.0, retry_after * 0.1))
+            return delay
+        return random.uniform(0, cap)
+
+    def retry_delay(self, exc: Exception, attempt: int, elapsed: float):
+        """
+        Decide whether to retry after a failed attempt.
+
+        Args:
+            exc (Exception): The error raised by the attempt
+            attempt (int): Number of retries already made for this call
+            elapsed (float): Seconds spent on this call so far
+
+        Returns:
+            float or None: Seconds to wait before retrying, or None to give up and re-raise
+        """
+        kind = classify_error(exc)
+        if kind == FATAL or attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt, kind, retry_after_seconds(exc) if kind == RATE_LIMITED else None)
+        if elapsed + delay > self.max_elapsed:
+            return None
+        return delay
+
+def get_retry_policy(stage: str = None) -> RetryPolicy:
+    """Return the retry policy for a pipeline stage"""
+    config = dict(DEFAULT_RETRY_POLICY)
+    config.update(RETRY_POLICIES.get(stage, {}))
+    config.update(_overrides.get(stage or "default", {}))
+    return RetryPolicy(**config)
+
+def _describe(exc: Exception) -> str:
+    return f"{type(exc).__name__}: {str(exc)[:200]}"
+
+def call_with_retry(fn, policy: RetryPolicy, logger=None, stage: str = None, on_retry=None):
+    """
+    Call fn() until it succeeds or the policy gives up (re-raising the last error).
+    on_retry(exc, delay), if given, is called before each retry.
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            delay = policy.retry_delay(e, attempt, time.monotonic() - started)
+            if delay is None:
+                raise
+            if logger:
+                logger.warning(f"LLM call for {stage or 'default'} failed ({classify_error(e)}, {_describe(e)}), "
+                               f"retry {attempt + 1}/{policy.max_attempts - 1} in {delay:.1f}s")
+            if on_retry:
+                on_retry(e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+async def acall_with_retry(coro_fn, policy: RetryPolicy, logger=None, stage: str = None, on_retry=None):
+    """Async variant of call_with_retry: awaits coro_fn() and sleeps without blocking the loop"""
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return await coro_fn()
+        except Exception as e:
+            delay = policy.retry_delay(e, attempt, time.monotonic() - started)
+            if delay is None:
+                raise
+            if logger:
+                logger.warning(f"LLM call for {stage or 'default'} failed ({classify_error(e)}, {_describe(e)}), "
+                               f"retry {attempt + 1}/{policy.max_attempts - 1} in {delay:.1f}s")
+            if on_retry:
+                on_retry(e, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
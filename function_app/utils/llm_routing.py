@@ -0,0 +1,31 @@
+import json
+import os
+
+# Strong model for stages that need deep code understanding, fast model for simple structured answers
+STRONG_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-exp-03-25")
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash")
+
+# Routing table: node class in nodes.py -> provider, model and generation parameters.
+# "params" is passed as the generation config (e.g. {"temperature": 0.2, "max_output_tokens": 1024}).
+ROUTES = {
+    "IdentifyAbstractions": {"provider": "gemini", "model": STRONG_MODEL, "params": {}},
+    "AnalyzeRelationships": {"provider": "gemini", "model": FAST_MODEL, "params": {}},
+    "OrderChapters": {"provider": "gemini", "model": FAST_MODEL, "params": {"temperature": 0}},
+    "WriteChapters": {"provider": "gemini", "model": STRONG_MODEL, "params": {}},
+}
+
+# Used for calls without a stage (or with an unknown one)
+DEFAULT_ROUTE = {"provider": "gemini", "model": STRONG_MODEL, "params": {}}
+
+# Optional overrides, e.g. LLM_ROUTES='{"OrderChapters": {"model": "gemini-2.5-pro-exp-03-25"}}'
+_overrides = json.loads(os.getenv("LLM_ROUTES", "{}"))
+
+def get_route(stage: str = None) -> dict:
+    """Return the {"provider", "model", "params"} route for a pipeline stage"""
+    route = dict(ROUTES.get(stage, DEFAULT_ROUTE))
+    route.update(_overrides.get(stage, {}))
+    return route
+
+def route_namespace(route: dict) -> str:
+    """Cache namespace for a route, so responses from different models/parameters never mix"""
+    return f"{route['provider']}:{route['model']}:{json.dumps(route.get('params', {}), sort_keys=True)}"
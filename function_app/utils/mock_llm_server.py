@@ -0,0 +1,272 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from utils.llm_cassette import Cassette
+except ImportError:  # Running this file directly (python utils/mock_llm_server.py)
+    from llm_cassette import Cassette
+
+# Local stand-in for the Gemini REST API (generateContent, streamGenerateContent and inline
+# batch jobs: batchGenerateContent, then GET batches/<id>). Point call_llm at it with
+# GEMINI_BASE_URL=http://127.0.0.1:<port> to load-test the whole flow offline: responses
+# come from a recorded cassette, with injected latency and errors.
+
+ERROR_BODIES = {
+    429: ("RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    500: ("INTERNAL", "An internal error has occurred."),
+    503: ("UNAVAILABLE", "The model is overloaded. Please try again later."),
+}
+
+def parse_latency(spec: str):
+    """
+    Build a latency sampler (returns seconds) from a spec string:
+        "fixed:0.5"            always 0.5 s
+        "uniform:0.2,2.0"      uniformly between 0.2 and 2.0 s
+        "normal:1.0,0.3"       normal with mean 1.0 s and stdev 0.3 s (clipped at 0)
+        "lognormal:0.0,0.8"    lognormal with mu 0.0 and sigma 0.8 (heavy tail)
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v] or [0.0]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Allow keep-alive connections
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        try:
+            self._handle_post()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request (e.g. a cancelled hedged request)
+            self.close_connection = True
+
+    def do_GET(self):
+        match = re.search(r"/(batches/[\w-]+)$", self.path)
+        with self.server.lock:
+            job = self.server.batches.get(match.group(1)) if match else None
+        if job is None:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {self.path}", "status": "NOT_FOUND"}})
+            return
+        self._send_json(200, self._batch_status(job))
+
+    @staticmethod
+    def _prompt_text(body):
+        return "".join(
+            part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+
+    def _lookup(self, prompt, model):
+        """Response text for a prompt: from the cassette, or the default response"""
+        server = self.server
+        text = server.cassette.lookup(prompt, model) if server.cassette else None
+        with server.lock:
+            server.stats["hits" if text is not None else "misses"] += 1
+        return text if text is not None else server.default_response
+
+    @staticmethod
+    def _usage(prompt, text):
+        return {
+            "promptTokenCount": max(1, len(prompt) // 4),
+            "candidatesTokenCount": max(1, len(text) // 4),
+            "totalTokenCount": max(1, len(prompt) // 4) + max(1, len(text) // 4),
+        }
+
+    def _handle_post(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        match = re.search(r"/models/([^/:]+):(\w+)", self.path)
+        if not match:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {self.path}", "status": "NOT_FOUND"}})
+            return
+        model, method = match.groups()
+        if method == "batchGenerateContent":
+            self._create_batch(model, body)
+            return
+        prompt = self._prompt_text(body)
+
+        with server.lock:
+            server.stats["requests"] += 1
+            delay = server.latency(server.rng)
+            fail = server.rng.random() < server.error_rate
+            error_code = server.rng.choice(server.error_codes) if fail else None
+        time.sleep(delay)
+
+        if error_code:
+            with server.lock:
+                server.stats["errors"] += 1
+            status, message = ERROR_BODIES.get(error_code, ("UNKNOWN", "Injected error."))
+            headers = {"Retry-After": "1"} if error_code == 429 else {}
+            self._send_json(error_code, {"error": {"code": error_code, "message": message, "status": status}}, headers)
+            return
+
+        text = self._lookup(prompt, model)
+        usage = self._usage(prompt, text)
+        if method == "generateContent":
+            self._send_json(200, self._candidate(text, usage))
+        elif method == "streamGenerateContent":
+            self._send_stream(text, usage)
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unsupported method {method}", "status": "NOT_FOUND"}})
+
+    def _create_batch(self, model, body):
+        """
+        Accept an inline batch job. Responses are produced right away (injected errors
+        fail single requests) and released once the job has run for the batch delay.
+        """
+        server = self.server
+        batch = body.get("batch", {})
+        requests = batch.get("inputConfig", {}).get("requests", {}).get("requests", [])
+        responses = []
+        for item in requests:
+            prompt = self._prompt_text(item.get("request", {}))
+            with server.lock:
+                fail = server.rng.random() < server.error_rate
+            if fail:
+                with server.lock:
+                    server.stats["errors"] += 1
+                responses.append({"error": {"code": 500, "message": "Injected error."}})
+            else:
+                text = self._lookup(prompt, model)
+                responses.append({"response": self._candidate(text, self._usage(prompt, text))})
+
+        with server.lock:
+            server.stats["batches"] += 1
+            server.stats["requests"] += len(requests)
+            name = f"batches/mock-{server.stats['batches']}"
+            job = server.batches[name] = {
+                "name": name,
+                "model": f"models/{model}",
+                "displayName": batch.get("displayName", ""),
+                "ready_at": time.monotonic() + server.batch_delay,
+                "responses": responses,
+            }
+        self._send_json(200, self._batch_status(job))
+
+    @staticmethod
+    def _batch_status(job):
+        """Batch job resource as returned by batches.get, with the responses once it has finished"""
+        done = time.monotonic() >= job["ready_at"]
+        metadata = {
+            "model": job["model"],
+            "displayName": job["displayName"],
+            "state": "BATCH_STATE_SUCCEEDED" if done else "BATCH_STATE_RUNNING",
+        }
+        if done:
+            metadata["output"] = {"inlinedResponses": {"inlinedResponses": job["responses"]}}
+        return {"name": job["name"], "metadata": metadata, "done": done}
+
+    @staticmethod
+    def _candidate(text, usage=None):
+        response = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+        if usage:
+            response["usageMetadata"] = usage
+        return response
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, text, usage):
+        """Send the response as server-sent events, in chunks spaced by the chunk delay"""
+        chunk_size = self.server.stream_chunk_size
+        pieces = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            payload = self._candidate(piece, usage if i == len(pieces) - 1 else None)
+            event = f"data: {json.dumps(payload)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+            if i < len(pieces) - 1:
+                time.sleep(self.server.stream_chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, cassette_path: str = None,
+                      latency: str = "fixed:0", error_rate: float = 0.0, error_codes=(429, 503),
+                      default_response: str = "Mock LLM response.", stream_chunk_size: int = 200,
+                      stream_chunk_delay: float = 0.0, batch_delay: float = 1.0, seed: int = None):
+    """
+    Start the mock Gemini server in a background thread.
+
+    Args:
+        host (str), port (int): Address to bind (port 0 picks a free port)
+        cassette_path (str, optional): Cassette (.jsonl) to serve recorded responses from
+        latency (str): Latency distribution spec, see parse_latency
+        error_rate (float): Fraction of requests answered with an injected error
+        error_codes (tuple): HTTP status codes to pick injected errors from
+        default_response (str): Response for prompts not found in the cassette
+        stream_chunk_size (int), stream_chunk_delay (float): Chunking of streamed responses
+        batch_delay (float): Seconds a batch job stays running before its responses are available
+        seed (int, optional): Seed for reproducible latency/error sequences
+
+    Returns:
+        tuple: (server, base_url). Call server.shutdown() to stop it; server.stats has request counts.
+    """
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.cassette = Cassette(cassette_path) if cassette_path else None
+    server.latency = parse_latency(latency)
+    server.error_rate = error_rate
+    server.error_codes = list(error_codes)
+    server.default_response = default_response
+    server.stream_chunk_size = stream_chunk_size
+    server.stream_chunk_delay = stream_chunk_delay
+    server.batch_delay = batch_delay
+    server.batches = {}  # name -> job
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.stats = {"requests": 0, "errors": 0, "hits": 0, "misses": 0, "batches": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local mock Gemini API for offline load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--cassette", help="Cassette (.jsonl) recorded with LLM_CASSETTE_MODE=record.")
+    parser.add_argument("--latency", default="fixed:0", help="Latency distribution, e.g. 'lognormal:0.5,0.8' (default: fixed:0).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (default: 0).")
+    parser.add_argument("--error-codes", default="429,503", help="Comma-separated status codes for injected errors.")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks.")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="Seconds before a batch job completes (default: 1).")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs.")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(
+        host=args.host, port=args.port, cassette_path=args.cassette, latency=args.latency,
+        error_rate=args.error_rate, error_codes=[int(c) for c in args.error_codes.split(",")],
+        stream_chunk_delay=args.chunk_delay, batch_delay=args.batch_delay, seed=args.seed,
+    )
+    print(f"Mock LLM server listening on {base_url}")
+    print(f"Run the flow against it with: GEMINI_BASE_URL={base_url} python main.py --dir <path>")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Stats: {server.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Rate limit configuration (0 disables the corresponding budget)
+DEFAULT_RPM = float(os.getenv("LLM_RPM", "0"))  # Requests per minute
+DEFAULT_TPM = float(os.getenv("LLM_TPM", "0"))  # Tokens per minute
+DEFAULT_STATE_PATH = os.getenv("LLM_RATE_LIMIT_PATH", "/tmp/llm_rate_limit.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token), used before the real count is known"""
+    return max(1, len(text) // 4)
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests-per-minute and tokens-per-minute budgets.
+
+    Bucket state lives in a small SQLite database, so every process on the host
+    that points at the same file draws from the same budget. Callers that would
+    exceed a budget sleep until enough capacity has refilled instead of failing.
+
+    Args:
+        name (str): Bucket name, one per model since Gemini quotas are per model (e.g. "gemini-2.0-flash")
+        rpm (float): Requests per minute (0 = unlimited)
+        tpm (float): Tokens per minute (0 = unlimited)
+        path (str): Path of the shared SQLite state file
+    """
+
+    def __init__(self, name: str = "gemini", rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM,
+                 path: str = DEFAULT_STATE_PATH):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, requests: float, tokens: float, force: bool = False) -> float:
+        """
+        Refill the buckets and try to take `requests` and `tokens` from them.
+
+        Returns 0 when the capacity was taken, otherwise the number of seconds
+        to wait before enough capacity will be available. With force=True the
+        amounts are always taken (buckets may go negative).
+        """
+        # A single request larger than the whole budget is allowed once the bucket is full
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row is None:
+                available_requests, available_tokens = self.rpm, self.tpm
+            else:
+                elapsed = max(0.0, now - row[2])
+                available_requests = min(self.rpm, row[0] + elapsed * self.rpm / 60)
+                available_tokens = min(self.tpm, row[1] + elapsed * self.tpm / 60)
+
+            wait = 0.0
+            if not force:
+                if self.rpm and available_requests < requests:
+                    wait = max(wait, (requests - available_requests) * 60 / self.rpm)
+                if self.tpm and available_tokens < tokens:
+                    wait = max(wait, (tokens - available_tokens) * 60 / self.tpm)
+            if wait == 0.0:
+                available_requests -= requests
+                available_tokens = min(self.tpm, available_tokens - tokens)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                (self.name, available_requests, available_tokens, now),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until one request and `tokens` tokens are available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            wait = self._update(1, tokens)
+            if wait == 0.0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Async variant of acquire that sleeps without blocking the event loop"""
+        import asyncio
+
+        waited = 0.0
+        while True:
+            wait = await asyncio.to_thread(self._update, 1, tokens)
+            if wait == 0.0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real token count of a call is known"""
+        if self.tpm and actual_tokens != estimated_tokens:
+            self._update(0, actual_tokens - estimated_tokens, force=True)
+
+# Process-wide limiters, one per bucket name
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name: str = "gemini"):
+    """
+    Return the shared RateLimiter for a bucket (the model name), or None if no budget
+    is configured. Every model gets its own LLM_RPM/LLM_TPM budget.
+    """
+    if not DEFAULT_RPM and not DEFAULT_TPM:
+        return None
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(name)
+        return _limiters[name]
@@ -1,8 +1,12 @@
 import dotenv
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 # Import the function that creates the flow
 from flow import create_tutorial_flow
+from utils.crawl_github_files import is_ssh_url
+from utils.llm_metrics import metrics
+from utils.llm_batch import set_batch_mode, batch_participant
 
 dotenv.load_dotenv()
 
@@ -27,6 +31,7 @@ def main():
     source_group = parser.add_mutually_exclusive_group(required=True)
     source_group.add_argument("--repo", help="URL of the public GitHub repository.")
     source_group.add_argument("--dir", help="Path to local directory.")
+    source_group.add_argument("--repo-list", help="File with one GitHub repository URL or local directory per line, processed together.")
 
     parser.add_argument("-n", "--name", help="Project name (optional, derived from repo/directory if omitted).")
     parser.add_argument("-t", "--token", help="GitHub personal access token (optional, reads from GITHUB_TOKEN env var if not provided).")
@@ -34,23 +39,59 @@ def main():
     parser.add_argument("-i", "--include", nargs="+", help="Include file patterns (e.g. '*.py' '*.js'). Defaults to common code files if not specified.")
     parser.add_argument("-e", "--exclude", nargs="+", help="Exclude file patterns (e.g. 'tests/*' 'docs/*'). Defaults to test/build directories if not specified.")
     parser.add_argument("-s", "--max-size", type=int, default=100000, help="Maximum file size in bytes (default: 100000, about 100KB).")
+    parser.add_argument("--ref", help="Branch, tag or commit to crawl when the repository URL does not name one (e.g. SSH URLs).")
+    parser.add_argument("--ingest", choices=["api", "archive"], help="How to fetch GitHub files: 'api' downloads matching files one by one, 'archive' streams the repository tarball once (default: GITHUB_INGEST or api).")
     # Add language parameter for multi-language support
     parser.add_argument("--language", default="english", help="Language for the generated tutorial (default: english)")
+    parser.add_argument("--no-stream", action="store_true", help="Write chapter files only at the end instead of streaming them as they are generated.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of --repo-list sources processed at the same time (default: 4).")
+    parser.add_argument("--batch", action="store_true", help="Submit LLM calls as batch jobs (cheaper, but jobs can take hours). Best combined with --repo-list.")
 
     args = parser.parse_args()
 
+    if args.batch:
+        set_batch_mode(True)
+
+    if args.repo_list:
+        with open(args.repo_list, encoding="utf-8") as f:
+            sources = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+    else:
+        sources = [args.repo or args.dir]
+
     # Get GitHub token from argument or environment variable if using repo
     github_token = None
-    if args.repo:
+    if args.repo or any(source.startswith(("http://", "https://")) for source in sources):
         github_token = args.token or os.environ.get('GITHUB_TOKEN')
         if not github_token:
             print("Warning: No GitHub token provided. You might hit rate limits for public repositories.")
 
-    # Initialize the shared dictionary with inputs
-    shared = {
-        "repo_url": args.repo,
-        "local_dir": args.dir,
-        "project_name": args.name, # Can be None, FetchRepo will derive it
+    if args.repo_list:
+        run_repo_list(sources, args, github_token)
+        return
+
+    shared = build_shared(args.repo, args.dir, args.name, github_token, args)
+
+    # Display starting message with repository/directory and language
+    print(f"Starting tutorial generation for: {args.repo or args.dir} in {args.language.capitalize()} language")
+
+    # Create the flow instance
+    tutorial_flow = create_tutorial_flow()
+
+    # Run the flow
+    with batch_participant():
+        tutorial_flow.run(shared)
+
+    # Show per-stage LLM latency, tokens and cost, and dump the metrics (JSON + Prometheus text)
+    print(metrics.format_report())
+    json_path, prom_path = metrics.write(name=shared["project_name"])
+    print(f"LLM metrics written to {json_path} and {prom_path}")
+
+def build_shared(repo_url, local_dir, project_name, github_token, args):
+    """Initialize the shared dictionary with the inputs of one flow run"""
+    return {
+        "repo_url": repo_url,
+        "local_dir": local_dir,
+        "project_name": project_name, # Can be None, FetchRepo will derive it
         "github_token": github_token,
         "output_dir": args.output, # Base directory for CombineTutorial output
 
@@ -58,12 +99,22 @@ def main():
         "include_patterns": set(args.include) if args.include else DEFAULT_INCLUDE_PATTERNS,
         "exclude_patterns": set(args.exclude) if args.exclude else DEFAULT_EXCLUDE_PATTERNS,
         "max_file_size": args.max_size,
+        "github_ingest": args.ingest,
+        "github_ref": args.ref,
+        # An earlier crawl (its commit_sha and files) to update instead of crawling everything
+        "previous_commit": None,
+        "previous_files": None,
 
         # Add language for multi-language support
         "language": args.language,
 
+        # Stream chapter content into the output files as the LLM generates it
+        "stream_chapters": not args.no_stream,
+
         # Outputs will be populated by the nodes
         "files": [],
+        "commit_sha": None,
+        "file_changes": None,
         "abstractions": [],
         "relationships": {},
         "chapter_order": [],
@@ -71,14 +122,37 @@ def main():
         "final_output_dir": None
     }
 
-    # Display starting message with repository/directory and language
-    print(f"Starting tutorial generation for: {args.repo or args.dir} in {args.language.capitalize()} language")
-
-    # Create the flow instance
-    tutorial_flow = create_tutorial_flow()
-
-    # Run the flow
-    tutorial_flow.run(shared)
+def run_repo_list(sources, args, github_token):
+    """
+    Run one flow per repository/directory, --workers of them at the same time.
+
+    With --batch, the flows' LLM calls are collected into shared batch jobs: a job is
+    submitted whenever every running flow is waiting on the LLM (see utils/llm_batch.py),
+    so each pipeline stage of the running repositories tends to end up in the same job.
+    """
+    failures = []
+
+    def run(source):
+        is_repo = source.startswith(("http://", "https://")) or is_ssh_url(source)
+        shared = build_shared(source if is_repo else None, None if is_repo else source, None, github_token, args)
+        # Flows are registered with the batch submitter for as long as they run
+        with batch_participant():
+            try:
+                create_tutorial_flow().run(shared)
+                print(f"Finished tutorial for {source}: {shared['final_output_dir']}")
+            except Exception as e:
+                print(f"Tutorial generation failed for {source}: {e}")
+                failures.append(source)
+
+    print(f"Starting tutorial generation for {len(sources)} sources in {args.language.capitalize()} language")
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        list(executor.map(run, sources))
+
+    print(metrics.format_report())
+    json_path, prom_path = metrics.write(name="repo_list")
+    print(f"LLM metrics written to {json_path} and {prom_path}")
+    if failures:
+        print(f"Failed: {', '.join(failures)}")
 
 if __name__ == "__main__":
     main()
@@ -2,7 +2,7 @@ import os
 import yaml
 from pocketflow import Node, BatchNode
 from utils.crawl_github_files import crawl_github_files
-from utils.call_llm import call_llm
+from utils.call_llm import call_llm, call_llm_stream, set_project
 from utils.crawl_local_files import crawl_local_files
 
 # Helper to get content for specific file indices
@@ -28,6 +28,9 @@ class FetchRepo(Node):
                 project_name = os.path.basename(os.path.abspath(local_dir))
             shared["project_name"] = project_name
 
+        # Tag cached LLM responses with the project so they can be exported per project
+        set_project(project_name)
+
         # Get file patterns directly from shared
         include_patterns = shared["include_patterns"]
         exclude_patterns = shared["exclude_patterns"]
@@ -40,7 +43,12 @@ class FetchRepo(Node):
             "include_patterns": include_patterns,
             "exclude_patterns": exclude_patterns,
             "max_file_size": max_file_size,
-            "use_relative_paths": True
+            "use_relative_paths": True,
+            "ingest": shared.get("github_ingest"),  # None: GITHUB_INGEST or "api"
+            "ref": shared.get("github_ref"),  # None: the ref in the URL, or the default branch
+            # An earlier crawl of the repository: only the files changed since are fetched
+            "previous_commit": shared.get("previous_commit"),
+            "previous_files": dict(shared["previous_files"]) if shared.get("previous_files") else None
         }
 
     def exec(self, prep_res):
@@ -52,7 +60,11 @@ class FetchRepo(Node):
                 include_patterns=prep_res["include_patterns"],
                 exclude_patterns=prep_res["exclude_patterns"],
                 max_file_size=prep_res["max_file_size"],
-                use_relative_paths=prep_res["use_relative_paths"]
+                use_relative_paths=prep_res["use_relative_paths"],
+                ingest=prep_res["ingest"],
+                ref=prep_res["ref"],
+                previous_commit=prep_res["previous_commit"],
+                previous_files=prep_res["previous_files"]
             )
         else:
             print(f"Crawling directory: {prep_res['local_dir']}...")
@@ -69,10 +81,14 @@ class FetchRepo(Node):
         if len(files_list) == 0:
             raise(ValueError("Failed to fetch files"))
         print(f"Fetched {len(files_list)} files.")
-        return files_list
+        stats = result.get("stats", {})
+        return files_list, stats.get("commit_sha"), stats.get("changes")
 
     def post(self, shared, prep_res, exec_res):
-        shared["files"] = exec_res # List of (path, content) tuples
+        files_list, commit_sha, changes = exec_res
+        shared["files"] = files_list # List of (path, content) tuples
+        shared["commit_sha"] = commit_sha # Crawled commit (GitHub only), the previous_commit of a later run
+        shared["file_changes"] = changes # {"added", "modified", "removed"} paths since previous_files, or None
 
 class IdentifyAbstractions(Node):
     def prep(self, shared):
@@ -146,7 +162,7 @@ Format the output as a YAML list of dictionaries:
     - 5 # path/to/another.js
 # ... up to 10 abstractions
 ```"""
-        response = call_llm(prompt)
+        response = call_llm(prompt, refresh_cache=(self.cur_retry > 0), stage="IdentifyAbstractions")
 
         # --- Validation ---
         yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
@@ -283,7 +299,7 @@ relationships:
 
 Now, provide the YAML output:
 """
-        response = call_llm(prompt)
+        response = call_llm(prompt, refresh_cache=(self.cur_retry > 0), stage="AnalyzeRelationships")
 
         # --- Validation ---
         yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
@@ -393,7 +409,7 @@ Output the ordered list of abstraction indices, including the name in a comment
 
 Now, provide the YAML output:
 """
-        response = call_llm(prompt)
+        response = call_llm(prompt, refresh_cache=(self.cur_retry > 0), stage="OrderChapters")
 
         # --- Validation ---
         yaml_str = response.strip().split("```yaml")[1].split("```")[0].strip()
@@ -446,6 +462,12 @@ class WriteChapters(BatchNode):
         # The 'previous_chapters_summary' will be built progressively in the exec context
         self.chapters_written_so_far = [] # Use instance variable for temporary storage across exec calls
 
+        # When streaming, chapters are appended to their output files as the LLM generates them
+        # (CombineTutorial later rewrites each file with the final content)
+        stream_dir = None
+        if shared.get("stream_chapters"):
+            stream_dir = os.path.join(shared.get("output_dir", "output"), shared["project_name"])
+
         # Create a complete list of all chapters
         all_chapters = []
         chapter_filenames = {} # Store chapter filename mapping for linking
@@ -496,6 +518,7 @@ class WriteChapters(BatchNode):
                     "prev_chapter": prev_chapter,  # Add previous chapter info (uses potentially translated name)
                     "next_chapter": next_chapter,  # Add next chapter info (uses potentially translated name)
                     "language": language,  # Add language for multi-language support
+                    "stream_path": os.path.join(stream_dir, chapter_filenames[abstraction_index]["filename"]) if stream_dir else None,
                     # previous_chapters_summary will be added dynamically in exec
                 })
             else:
@@ -506,6 +529,9 @@ class WriteChapters(BatchNode):
 
     def exec(self, item):
         # This runs for each item prepared above
+        if self.cur_retry == 0:
+            # Chunks streamed so far, kept across retries (and for exec_fallback) so a broken stream can be resumed
+            self._partial_chapter = []
         abstraction_name = item["abstraction_details"]["name"] # Potentially translated name
         abstraction_description = item["abstraction_details"]["description"] # Potentially translated description
         chapter_num = item["chapter_num"]
@@ -594,7 +620,34 @@ Instructions for the chapter (Generate content in {language.capitalize()} unless
 
 Now, directly provide a super beginner-friendly Markdown output (DON'T need ```markdown``` tags):
 """
-        chapter_content = call_llm(prompt)
+        partial_content = "".join(self._partial_chapter)
+        if item.get("stream_path") and partial_content.strip():
+            # An earlier attempt broke off mid-stream: continue its output instead of starting over
+            print(f"Resuming chapter {chapter_num} after {len(partial_content)} characters of streamed output...")
+            prompt += f"""
+IMPORTANT: An earlier attempt at this chapter was cut off. Its output so far is below. Continue the chapter exactly where it stops, without repeating any of it and without any preamble:
+
+{partial_content}"""
+        if item.get("stream_path"):
+            chapter_content = self._stream_chapter(prompt, item["stream_path"])
+        else:
+            chapter_content = call_llm(prompt, refresh_cache=(self.cur_retry > 0), stage="WriteChapters")
+        return self._finish_chapter(item, chapter_content)
+
+    def _stream_chapter(self, prompt, stream_path):
+        """Stream the chapter from the LLM, appending each chunk to its output file (after what earlier attempts streamed)"""
+        os.makedirs(os.path.dirname(stream_path), exist_ok=True)
+        with open(stream_path, "a" if self._partial_chapter else "w", encoding="utf-8") as f:
+            for chunk in call_llm_stream(prompt, refresh_cache=(self.cur_retry > 0), stage="WriteChapters"):
+                self._partial_chapter.append(chunk)
+                f.write(chunk)
+                f.flush()
+        print(f"  - Streamed {stream_path}")
+        return "".join(self._partial_chapter)
+
+    def _finish_chapter(self, item, chapter_content):
+        abstraction_name = item["abstraction_details"]["name"]
+        chapter_num = item["chapter_num"]
         # Basic validation/cleanup
         actual_heading = f"# Chapter {chapter_num}: {abstraction_name}" # Use potentially translated name
         if not chapter_content.strip().startswith(f"# Chapter {chapter_num}"):
@@ -611,11 +664,22 @@ Now, directly provide a super beginner-friendly Markdown output (DON'T need ```m
 
         return chapter_content # Return the Markdown string (potentially translated)
 
+    def exec_fallback(self, item, exc):
+        # If the stream broke after producing output (in any attempt), keep the partial chapter instead
+        # of failing the flow, but mark it as incomplete
+        partial_content = "".join(self._partial_chapter)
+        if not item.get("stream_path") or not partial_content.strip():
+            raise exc
+        print(f"Warning: Chapter {item['chapter_num']} is incomplete: generation failed mid-stream ({exc}). Keeping {len(partial_content)} characters of partial output.")
+        partial_content = partial_content.rstrip() + "\n\n---\n\n> **Note:** This chapter is incomplete. Its generation was interrupted, and the text above is what was written before it stopped.\n"
+        return self._finish_chapter(item, partial_content)
+
     def post(self, shared, prep_res, exec_res_list):
         # exec_res_list contains the generated Markdown for each chapter, in order
         shared["chapters"] = exec_res_list
-        # Clean up the temporary instance variable
+        # Clean up the temporary instance variables
         del self.chapters_written_so_far
+        self._partial_chapter = None
         print(f"Finished writing {len(exec_res_list)} chapters.")
 
 class CombineTutorial(Node):
@@ -0,0 +1,46 @@
+import statistics
+import time
+
+from google import genai
+from google.genai import types
+
+try:
+    from utils.llm_client import get_client
+    from utils.mock_llm_server import start_mock_server
+except ImportError:  # Running this file directly (python utils/benchmark_llm_client.py)
+    from llm_client import get_client
+    from mock_llm_server import start_mock_server
+
+def run_benchmark(n_calls: int = 200, model: str = "stub-model"):
+    """Measure per-call latency with a fresh client per call vs. the shared client registry"""
+    # Zero-latency mock endpoint, so only client overhead is measured
+    server, base_url = start_mock_server()
+
+    def time_calls(make_client):
+        timings = []
+        for _ in range(n_calls):
+            start = time.perf_counter()
+            client = make_client()
+            client.models.generate_content(model=model, contents=["ping"])
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    results = {
+        "fresh client per call": time_calls(
+            lambda: genai.Client(api_key="stub-key", http_options=types.HttpOptions(base_url=base_url))
+        ),
+        "shared client (registry)": time_calls(
+            lambda: get_client("gemini", api_key="stub-key", model=model, base_url=base_url)
+        ),
+    }
+    server.shutdown()
+
+    print(f"Per-call latency over {n_calls} calls against a local stub endpoint ({base_url}):")
+    for label, timings in results.items():
+        timings.sort()
+        print(f"  {label:26s} mean {statistics.mean(timings):7.2f} ms | "
+              f"p50 {timings[len(timings) // 2]:7.2f} ms | p95 {timings[int(len(timings) * 0.95)]:7.2f} ms")
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+
+import git
+
+try:
+    import fcntl  # Not available on Windows: mirrors are then used without locking
+except ImportError:
+    fcntl = None
+
+# Persistent bare mirrors of cloned repositories (override via environment variables).
+# A crawl only fetches objects that are new since the last one and reads files straight
+# from the git object store, without a working tree. Mirrors are partial clones: the
+# history comes without file contents, which are fetched only for the files a crawl reads.
+DEFAULT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "git_mirrors")  # Empty = shallow clone into a temp dir every time
+DEFAULT_MAX_BYTES = int(os.getenv("GIT_MIRROR_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))  # 0 = unlimited
+
+# Branches and tags are mirrored as-is
+MIRROR_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+# Commits and trees only; blobs are fetched on demand (see fetch_blobs)
+PARTIAL_FILTER = "blob:none"
+FETCH_BATCH_SIZE = 1000  # Blobs requested per fetch
+
+def mirror_name(repo_url: str) -> str:
+    """Directory name of the mirror of a remote: readable repository name plus a hash of the URL"""
+    name = re.sub(r"\.git$", "", repo_url.rstrip("/")).rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name) or "repo"
+    return f"{name}-{hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:12]}.git"
+
+@contextmanager
+def _locked(lock_path: str, blocking: bool = True):
+    """
+    Hold an exclusive lock on a file while the block runs. Yields False (without locking)
+    if blocking is False and another process holds the lock.
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+def _remote_default_branch(repo: git.Repo) -> str:
+    """Name of the branch the remote's HEAD points to"""
+    output = repo.git.ls_remote("--symref", "origin", "HEAD")
+    match = re.search(r"^ref: refs/heads/(\S+)\s+HEAD", output, re.MULTILINE)
+    if not match:
+        raise ValueError("Could not determine the default branch of the remote")
+    return match.group(1)
+
+@contextmanager
+def mirror_commit(repo_url: str, ref: str = None, cache_dir: str = DEFAULT_MIRROR_DIR):
+    """
+    Update the mirror of a remote and yield the commit to read, holding the mirror's lock.
+
+    The first use creates a bare mirror of all branches and tags; later uses fetch only
+    the objects that are new. A commit SHA that is already in the mirror needs no fetch.
+
+    Args:
+        repo_url (str): Remote URL (e.g. git@github.com:owner/repo.git)
+        ref (str, optional): Branch, tag or commit SHA (default: the remote's default branch)
+        cache_dir (str): Directory holding the mirrors
+
+    Yields:
+        git.Commit: The commit, whose tree and blobs can be read from the mirror
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, mirror_name(repo_url))
+    with _locked(path + ".lock"):
+        if not os.path.isdir(path):
+            print(f"Creating mirror of {repo_url} in {path} ...")
+            repo = git.Repo.init(path, bare=True)
+            repo.git.remote("add", "origin", repo_url)
+            # Mark the remote as the promisor of the objects left out by the filter
+            repo.git.config("remote.origin.promisor", "true")
+            repo.git.config("remote.origin.partialclonefilter", PARTIAL_FILTER)
+        else:
+            repo = git.Repo(path)
+
+        commit = None
+        if ref and re.fullmatch(r"[0-9a-f]{40}", ref):
+            try:
+                commit = repo.commit(ref)
+            except (ValueError, git.BadName):
+                pass
+        if commit is None:
+            repo.git.fetch(f"--filter={PARTIAL_FILTER}", "--prune", "--no-tags", "origin", *MIRROR_REFSPECS)
+            name = ref or _remote_default_branch(repo)
+            try:
+                commit = repo.commit(name)
+            except (ValueError, git.BadName):
+                # A commit that no branch or tag points to (anymore)
+                repo.git.fetch(f"--filter={PARTIAL_FILTER}", "origin", name)
+                commit = repo.commit("FETCH_HEAD")
+
+        # Mark the mirror as recently used for eviction
+        os.utime(path)
+        yield commit
+
+def fetch_blobs(commit: git.Commit, blobs) -> int:
+    """
+    Fetch the contents of the given blobs of a commit that the mirror does not have yet,
+    a batch at a time (reading a missing blob would otherwise fetch it on its own).
+    Call while holding the mirror's lock. Returns the number of blobs fetched.
+
+    Args:
+        commit (git.Commit): Commit yielded by mirror_commit
+        blobs (list): git.Blob objects of the commit's tree that are about to be read
+    """
+    repo = commit.repo
+    # Objects of the commit's tree that are not in the mirror, listed without fetching them
+    output = repo.git.rev_list("--objects", "--no-walk", "--missing=print", commit.hexsha)
+    missing = {line[1:] for line in output.splitlines() if line.startswith("?")}
+    wanted = sorted({blob.hexsha for blob in blobs} & missing)
+    for start in range(0, len(wanted), FETCH_BATCH_SIZE):
+        repo.git.fetch(f"--filter={PARTIAL_FILTER}", "--no-tags", "--no-write-fetch-head",
+                       "origin", *wanted[start:start + FETCH_BATCH_SIZE])
+    return len(wanted)
+
+def evict_mirrors(cache_dir: str = DEFAULT_MIRROR_DIR, max_bytes: int = DEFAULT_MAX_BYTES) -> list:
+    """
+    Delete least recently used mirrors until the cache fits in max_bytes. Mirrors in use
+    by another crawl (locked) are skipped. Returns the paths of the deleted mirrors.
+
+    Lock files are left in place: another process may already have opened one to
+    wait for the lock, and would otherwise lock a file that a third one recreates.
+    """
+    if not max_bytes or not os.path.isdir(cache_dir):
+        return []
+    mirrors = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(".git") and os.path.isdir(path):
+            mirrors.append((os.path.getmtime(path), path, _dir_size(path)))
+    total = sum(size for _, _, size in mirrors)
+
+    removed = []
+    for _, path, size in sorted(mirrors):
+        if total <= max_bytes:
+            break
+        with _locked(path + ".lock", blocking=False) as acquired:
+            if not acquired:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed.append(path)
+        print(f"Evicted git mirror {path} ({size / 1024 / 1024:.1f} MB)")
+    return removed
+
+if __name__ == "__main__":
+    # Show the mirrors, least recently used first
+    if not os.path.isdir(DEFAULT_MIRROR_DIR):
+        print(f"No mirrors in {DEFAULT_MIRROR_DIR}")
+    else:
+        for name in sorted(os.listdir(DEFAULT_MIRROR_DIR), key=lambda n: os.path.getmtime(os.path.join(DEFAULT_MIRROR_DIR, n))):
+            path = os.path.join(DEFAULT_MIRROR_DIR, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(path)))
+                print(f"{name}: {_dir_size(path) / 1024 / 1024:.1f} MB, last used {last_used}")
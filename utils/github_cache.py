@@ -0,0 +1,396 @@
+import sqlite3
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Conditional-request cache for GitHub (override via environment variables).
+# Responses are stored with their ETag/Last-Modified; later requests for the same URL send
+# If-None-Match/If-Modified-Since and a 304 is answered from the stored body. GitHub does not
+# count 304 responses against the rate limit.
+DEFAULT_CACHE_PATH = os.getenv("GITHUB_CACHE_PATH", "github_cache.db")  # Empty = disabled
+DEFAULT_MAX_BYTES = int(os.getenv("GITHUB_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 0 = unlimited
+# File contents are also stored by git blob SHA, so a file seen in any ref, fork or earlier
+# run is served locally without a request
+DEFAULT_BLOB_MAX_BYTES = int(os.getenv("GITHUB_BLOB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 0 = unlimited
+COMPRESS_MIN_BYTES = 256  # Shorter bodies are stored uncompressed
+EVICT_TO = 0.9  # Eviction frees space down to this fraction of the cap, so it runs once per batch of inserts
+FLUSH_INTERVAL = 5.0  # Seconds between writes of the buffered hit counters and access times
+
+# Response headers kept with a cached body
+STORED_HEADERS = ("content-type", "etag", "last-modified", "link")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS http_responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    headers TEXT NOT NULL,             -- JSON object of STORED_HEADERS
+    body BLOB NOT NULL,
+    compressed INTEGER NOT NULL,       -- 1 if body is zlib-compressed
+    size INTEGER NOT NULL,             -- Stored bytes
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_http_responses_accessed_at ON http_responses(accessed_at);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha TEXT PRIMARY KEY,              -- git blob SHA-1 of the content
+    content BLOB NOT NULL,
+    compressed INTEGER NOT NULL,       -- 1 if content is zlib-compressed
+    size INTEGER NOT NULL,             -- Stored bytes
+    raw_size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_accessed_at ON blobs(accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_sizes (
+    name TEXT PRIMARY KEY,             -- Table whose stored bytes are tracked
+    bytes INTEGER NOT NULL             -- Running total of its size column, kept by triggers
+);
+"""
+
+# Tables with a size cap; triggers keep their total in table_sizes so checking the cap
+# never has to scan the stored bodies
+SIZED_TABLES = ("http_responses", "blobs")
+
+SIZE_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {table}_size_insert AFTER INSERT ON {table} BEGIN
+    UPDATE table_sizes SET bytes = bytes + NEW.size WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_size_delete AFTER DELETE ON {table} BEGIN
+    UPDATE table_sizes SET bytes = bytes - OLD.size WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_size_update AFTER UPDATE OF size ON {table} BEGIN
+    UPDATE table_sizes SET bytes = bytes + NEW.size - OLD.size WHERE name = '{table}';
+END;
+"""
+
+def request_key(url: str, params: dict = None, headers: dict = None) -> str:
+    """
+    Cache key of a GET request: URL, query parameters, Accept header and the token used.
+    The token is part of the key (hashed) so private content never leaks across tokens.
+    """
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    parts = [
+        url,
+        json.dumps(sorted((params or {}).items())),
+        headers.get("accept", ""),
+        hashlib.sha256(headers.get("authorization", "").encode("utf-8")).hexdigest(),
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+def git_blob_sha(content: bytes) -> str:
+    """SHA-1 that git (and the GitHub tree API) uses to name a blob with this content"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+def _pack(data: bytes):
+    """Compress data for storage if it pays off. Returns (payload, compressed)."""
+    if len(data) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data):
+            return packed, 1
+    return data, 0
+
+def _build_response(url: str, status_code: int, headers, body: bytes) -> requests.Response:
+    """A requests.Response carrying a stored body"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response.url = url
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+class GitHubCache:
+    """
+    SQLite-backed HTTP cache for GitHub API and raw file responses.
+
+    Like the LLM cache (see utils/llm_cache.py), the database runs in WAL mode and each
+    thread gets its own connection, so concurrent download workers and processes can
+    share one file. Least recently used entries are evicted above max_bytes.
+
+    File contents are also kept in a content-addressed blob table keyed by git blob SHA,
+    with its own LRU size cap (see get_blob/put_blob).
+
+    Args:
+        path (str): Path of the SQLite database file
+        max_bytes (int, optional): Evict least recently used entries once the stored bodies
+                                   exceed this many bytes (0 = unlimited)
+        blob_max_bytes (int, optional): Same for the blob store
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 blob_max_bytes: int = DEFAULT_BLOB_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.blob_max_bytes = blob_max_bytes
+        self._local = threading.local()
+        # Hit counters and access times are buffered and written in one transaction every
+        # FLUSH_INTERVAL seconds, so lookups do not compete for the write lock
+        self._pending_lock = threading.Lock()
+        self._pending_counts = {}
+        self._pending_touches = {}  # (table, key column) -> {key: accessed_at}
+        self._last_flush = time.monotonic()
+        self._evict_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+        self._init_sizes()
+        atexit.register(self.flush)
+
+    def _init_sizes(self):
+        """Create the size triggers and compute the totals once for databases that predate them"""
+        with self._transaction() as conn:
+            for table in SIZED_TABLES:
+                if conn.execute("SELECT 1 FROM table_sizes WHERE name = ?", (table,)).fetchone() is None:
+                    conn.execute(
+                        f"INSERT INTO table_sizes (name, bytes) SELECT ?, COALESCE(SUM(size), 0) FROM {table}", (table,)
+                    )
+                for statement in SIZE_TRIGGERS.format(table=table).split("END;"):
+                    if statement.strip():
+                        conn.execute(statement + "END;")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the connection for the current thread/process, opening it if needed"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        # isolation_level=None: we manage transactions explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction, taking the write lock up front"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _count(self, name: str):
+        with self._pending_lock:
+            self._pending_counts[name] = self._pending_counts.get(name, 0) + 1
+        self.flush(force=False)
+
+    def _touch(self, table: str, key_column: str, key: str):
+        """Record an access for LRU eviction (written with the next flush)"""
+        with self._pending_lock:
+            self._pending_touches.setdefault((table, key_column), {})[key] = time.time()
+
+    def flush(self, force: bool = True):
+        """Write the buffered counters and access times (at most every FLUSH_INTERVAL seconds unless forced)"""
+        with self._pending_lock:
+            if not force and time.monotonic() - self._last_flush < FLUSH_INTERVAL:
+                return
+            counts, self._pending_counts = self._pending_counts, {}
+            touches, self._pending_touches = self._pending_touches, {}
+            self._last_flush = time.monotonic()
+        if not counts and not touches:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    counts.items(),
+                )
+                for (table, key_column), accessed in touches.items():
+                    conn.executemany(
+                        f"UPDATE {table} SET accessed_at = MAX(accessed_at, ?) WHERE {key_column} = ?",
+                        [(at, key) for key, at in accessed.items()],
+                    )
+        except sqlite3.Error:
+            pass  # Statistics and LRU order only; never fail a request over them
+
+    def get(self, session: requests.Session, url: str, headers: dict = None, params: dict = None,
+            **kwargs) -> requests.Response:
+        """
+        GET a URL with a conditional request if a validator is stored for it.
+
+        A 304 is turned into a 200 response with the stored body (response.from_cache is
+        True); a new 200 response with an ETag or Last-Modified is stored. Other
+        responses are returned unchanged.
+        """
+        key = request_key(url, params, headers)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT etag, last_modified, headers, body, compressed FROM http_responses WHERE key = ?", (key,)
+        ).fetchone()
+
+        request_headers = dict(headers or {})
+        if row is not None:
+            etag, last_modified = row[0], row[1]
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+
+        response = session.get(url, headers=request_headers, params=params, **kwargs)
+
+        if response.status_code == 304 and row is not None:
+            stored_headers = json.loads(row[2])
+            # Keep the fresh rate limit headers of the 304
+            stored_headers.update({name: value for name, value in response.headers.items()
+                                   if name.lower().startswith("x-ratelimit")})
+            body = zlib.decompress(row[3]) if row[4] else row[3]
+            self._touch("http_responses", "key", key)
+            self._count("not_modified")
+            cached = _build_response(response.url or url, 200, stored_headers, body)
+            cached.from_cache = True
+            return cached
+
+        response.from_cache = False
+        if response.status_code == 200 and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            try:
+                self._store(key, url, response)
+            except sqlite3.Error as e:
+                print(f"Failed to store {url} in the GitHub cache: {e}")
+        self._count("fetched")
+        return response
+
+    def _store(self, key: str, url: str, response: requests.Response):
+        body, compressed = _pack(response.content)
+        stored_headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+        now = time.time()
+        # An upsert rather than INSERT OR REPLACE: the replaced row's delete would not fire the size trigger
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO http_responses "
+                "(key, url, etag, last_modified, headers, body, compressed, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+                "headers = excluded.headers, body = excluded.body, compressed = excluded.compressed, "
+                "size = excluded.size, created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                (key, url, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                 json.dumps(stored_headers), body, compressed, len(body), now, now),
+            )
+        self._evict("http_responses", "key", self.max_bytes)
+
+    def get_blob(self, sha: str):
+        """Return the content of a git blob if it is stored, else None"""
+        conn = self._connect()
+        row = conn.execute("SELECT content, compressed FROM blobs WHERE sha = ?", (sha,)).fetchone()
+        if row is None:
+            self._count("blob_misses")
+            return None
+        self._touch("blobs", "sha", sha)
+        self._count("blob_hits")
+        return zlib.decompress(row[0]) if row[1] else row[0]
+
+    def put_blob(self, content: bytes, sha: str = None) -> bool:
+        """
+        Store file content under its git blob SHA. If the expected sha is given and does
+        not match the content (e.g. a transformed download), nothing is stored.
+        Returns whether the blob was stored.
+        """
+        actual = git_blob_sha(content)
+        if sha is not None and sha != actual:
+            return False
+        payload, compressed = _pack(content)
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs (sha, content, compressed, size, raw_size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (actual, payload, compressed, len(payload), len(content), now, now),
+                )
+        except sqlite3.Error as e:
+            print(f"Failed to store blob {actual} in the GitHub cache: {e}")
+            return False
+        self._evict("blobs", "sha", self.blob_max_bytes)
+        return True
+
+    def _table_bytes(self, table: str) -> int:
+        """Stored bytes of a table"""
+        row = self._connect().execute("SELECT bytes FROM table_sizes WHERE name = ?", (table,)).fetchone()
+        return row[0] if row else 0
+
+    def _evict(self, table: str, key_column: str, max_bytes: int) -> int:
+        """
+        Delete least recently used rows of a table once their stored size exceeds max_bytes,
+        down to EVICT_TO of it. The victims are picked outside the write lock; only the
+        deletes run in a transaction. One thread per process evicts at a time.
+        """
+        if not max_bytes or self._table_bytes(table) <= max_bytes:
+            return 0
+        if not self._evict_lock.acquire(blocking=False):
+            return 0
+        try:
+            self.flush()  # Let pending access times count
+            excess = self._table_bytes(table) - int(max_bytes * EVICT_TO)
+            freed = 0
+            victims = []
+            cursor = self._connect().execute(f"SELECT {key_column}, size FROM {table} ORDER BY accessed_at")
+            for key, size in cursor:
+                if freed >= excess:
+                    break
+                victims.append((key,))
+                freed += size
+            cursor.close()
+            with self._transaction() as conn:
+                conn.executemany(f"DELETE FROM {table} WHERE {key_column} = ?", victims)
+            return len(victims)
+        except sqlite3.Error as e:
+            print(f"Failed to evict from the GitHub cache: {e}")
+            return 0
+        finally:
+            self._evict_lock.release()
+
+    def stats(self) -> dict:
+        """Entry counts, stored bytes and request counters"""
+        self.flush()
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM http_responses").fetchone()[0]
+        size = self._table_bytes("http_responses")
+        blobs = conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        blob_size = self._table_bytes("blobs")
+        counters = dict(conn.execute("SELECT name, value FROM counters"))
+        return {"entries": entries, "bytes": size, "not_modified": counters.get("not_modified", 0),
+                "fetched": counters.get("fetched", 0), "blobs": blobs, "blob_bytes": blob_size,
+                "blob_hits": counters.get("blob_hits", 0), "blob_misses": counters.get("blob_misses", 0)}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_github_cache(path: str = DEFAULT_CACHE_PATH):
+    """Return the shared GitHubCache for a database path, or None if caching is disabled"""
+    if not path:
+        return None
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = GitHubCache(path)
+        return _caches[path]
+
+if __name__ == "__main__":
+    cache = get_github_cache()
+    if cache is None:
+        print("GitHub cache is disabled (GITHUB_CACHE_PATH is empty)")
+    else:
+        stats = cache.stats()
+        print(f"{cache.path}: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB, "
+              f"{stats['not_modified']} requests answered by 304, {stats['fetched']} fetched")
+        print(f"Blob store: {stats['blobs']} blobs, {stats['blob_bytes'] / 1024 / 1024:.1f} MB, "
+              f"{stats['blob_hits']} hits, {stats['blob_misses']} misses")
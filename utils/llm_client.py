@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+import weakref
+
+# Process-wide registry of long-lived LLM clients.
+# Each client owns an HTTP connection pool, so reusing it keeps connections warm
+# and skips the TLS handshake and auth setup that a fresh client pays on every call.
+_clients = {}
+_clients_lock = threading.Lock()
+# Async connection pools are bound to the event loop that first uses them, so async calls
+# get a client per loop, dropped together with the loop
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {client key: client}
+
+def _reset_after_fork():
+    """Drop clients inherited from the parent; their sockets must not be shared across processes."""
+    global _clients_lock
+    _clients.clear()
+    _async_clients.clear()
+    _clients_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _create_client(provider: str, api_key: str, base_url: str = None):
+    """Construct a new client for the given provider"""
+    if provider == "gemini":
+        from google import genai
+        from google.genai import types
+
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        return genai.Client(api_key=api_key, http_options=http_options)
+    if provider == "anthropic":
+        from anthropic import Anthropic
+        return Anthropic(api_key=api_key, base_url=base_url)
+    if provider == "openai":
+        from openai import OpenAI
+        return OpenAI(api_key=api_key, base_url=base_url)
+    raise ValueError(f"Unsupported LLM provider: {provider}")
+
+def _client_key(provider: str, api_key: str, model: str, base_url: str) -> tuple:
+    if api_key is None and provider == "gemini":
+        api_key = os.getenv("GEMINI_API_KEY", "your-api-key")
+    if base_url is None and provider == "gemini":
+        base_url = os.getenv("GEMINI_BASE_URL")
+    return provider, api_key, model, base_url
+
+def get_client(provider: str = "gemini", api_key: str = None, model: str = None, base_url: str = None):
+    """
+    Return the shared client for (provider, api key, model), creating it on first use.
+
+    Args:
+        provider (str): One of "gemini", "anthropic" or "openai"
+        api_key (str, optional): API key; defaults to GEMINI_API_KEY for Gemini
+        model (str, optional): Model name the client is used for
+        base_url (str, optional): Override the API endpoint (e.g. a local stub server)
+
+    Returns:
+        The provider SDK client. Clients are thread-safe and may be used concurrently.
+    """
+    key = _client_key(provider, api_key, model, base_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_client(*key[:2], key[3])
+            _clients[key] = client
+        return client
+
+def get_async_client(provider: str = "gemini", api_key: str = None, model: str = None, base_url: str = None):
+    """
+    Return the client for (provider, api key, model) to make async calls from the running
+    event loop with (e.g. client.aio for Gemini), creating it on first use in that loop.
+    A client shared across loops would fail once the loop that opened its connections
+    is closed, e.g. on the second asyncio.run() in a process.
+
+    Args:
+        provider (str): One of "gemini", "anthropic" or "openai"
+        api_key (str, optional): API key; defaults to GEMINI_API_KEY for Gemini
+        model (str, optional): Model name the client is used for
+        base_url (str, optional): Override the API endpoint (e.g. a local stub server)
+
+    Returns:
+        The provider SDK client, only to be used from the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    key = _client_key(provider, api_key, model, base_url)
+    with _clients_lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = _create_client(*key[:2], key[3])
+            loop_clients[key] = client
+        return client
+
+def clear_clients():
+    """Forget all cached clients (e.g. after rotating an API key)"""
+    with _clients_lock:
+        _clients.clear()
+        _async_clients.clear()
@@ -0,0 +1,238 @@
+import asyncio
+import collections
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from utils.llm_metrics import percentile
+except ImportError:  # Running from inside utils/
+    from llm_metrics import percentile
+
+# Hedged requests: when an API call runs longer than a percentile of the latencies observed
+# for its stage, a duplicate request is fired and whichever finishes first is used.
+#   LLM_HEDGE=1               -> enable hedging for every stage (default: off)
+#   LLM_HEDGE_MAX_RATIO       -> at most this fraction of API calls may be hedged (default: 0.1)
+#   LLM_HEDGE_MAX_EXTRA_USD   -> stop hedging once losing requests cost this much (0 = no limit)
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes")
+HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+HEDGE_MAX_EXTRA_USD = float(os.getenv("LLM_HEDGE_MAX_EXTRA_USD", "0"))
+
+# Hedge policy per node class in nodes.py
+#   percentile: hedge once a call has run longer than this percentile of the stage's latencies
+#   min_samples: observed calls needed before hedging (no hedging while the stage is cold)
+#   min_delay: never hedge earlier than this many seconds
+#   window: number of recent latencies the percentile is computed over
+DEFAULT_HEDGE_POLICY = {"enabled": HEDGE_ENABLED, "percentile": 95, "min_samples": 20, "min_delay": 2.0, "window": 200}
+HEDGE_POLICIES = {
+    # Few, long calls with a heavy tail: hedge a little earlier
+    "WriteChapters": {"percentile": 90, "min_samples": 5, "min_delay": 10.0},
+}
+
+# Optional overrides, e.g. LLM_HEDGE_POLICIES='{"WriteChapters": {"enabled": true, "percentile": 85}}'
+_overrides = json.loads(os.getenv("LLM_HEDGE_POLICIES", "{}"))
+
+def get_hedge_policy(stage: str = None) -> dict:
+    """Return the hedge policy for a pipeline stage"""
+    policy = dict(DEFAULT_HEDGE_POLICY)
+    policy.update(HEDGE_POLICIES.get(stage, {}))
+    policy.update(_overrides.get(stage or "default", {}))
+    return policy
+
+class Hedger:
+    """
+    Runs API requests with an optional hedge, tracking per-stage latency and the extra spend.
+
+    The hedge delay is the policy percentile of the recent single-request latencies of
+    the stage. Hedges are capped to a fraction of all requests (max_ratio) and stop once
+    the losing requests have cost max_extra_usd.
+    """
+
+    def __init__(self, max_ratio: float = HEDGE_MAX_RATIO, max_extra_usd: float = HEDGE_MAX_EXTRA_USD,
+                 max_workers: int = 32):
+        self.max_ratio = max_ratio
+        self.max_extra_usd = max_extra_usd
+        self._lock = threading.Lock()
+        self._latencies = {}  # stage -> deque of seconds
+        self._requests = 0
+        self._hedges = 0
+        self.extra_usd = 0.0
+        self._max_workers = max_workers
+        self._pool = None
+
+    def observe(self, stage: str, seconds: float, window: int = 200):
+        """Record the latency of one successful request"""
+        with self._lock:
+            samples = self._latencies.get(stage)
+            if samples is None or samples.maxlen != window:
+                samples = self._latencies[stage] = collections.deque(samples or (), maxlen=window)
+            samples.append(seconds)
+
+    def hedge_delay(self, stage: str, policy: dict):
+        """Seconds after which to hedge a request of this stage, or None to not hedge it"""
+        if not policy["enabled"]:
+            return None
+        with self._lock:
+            samples = list(self._latencies.get(stage, ()))
+        if len(samples) < policy["min_samples"]:
+            return None
+        return max(policy["min_delay"], percentile(samples, policy["percentile"]))
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            if self.max_extra_usd and self.extra_usd >= self.max_extra_usd:
+                return False
+            if self._hedges + 1 > self.max_ratio * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+    def add_extra_spend(self, usd: float):
+        """Account for the cost of a losing request"""
+        with self._lock:
+            self.extra_usd += usd
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="llm-hedge")
+            return self._pool
+
+    def _timed(self, fn):
+        started = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - started
+
+    def call(self, stage: str, fn, on_discard=None, on_hedge=None, series: str = None):
+        """
+        Call fn() and, if it runs past the stage's hedge delay, race it against a second fn().
+
+        Args:
+            stage (str): Pipeline stage, for the latency statistics and policy
+            fn (callable): Makes one API request and returns its result
+            on_discard (callable, optional): Called with the result of the losing request once it
+                                             completes; returns its cost in USD (counted against max_extra_usd)
+            on_hedge (callable, optional): Called with "fired", then "won" or "lost" (hedge outcome)
+            series (str, optional): Latency series to use instead of the stage (e.g. time to first chunk)
+
+        Returns:
+            The result of the first request to succeed. If both fail, the primary's error is raised.
+        """
+        policy = get_hedge_policy(stage)
+        stage = series or stage
+        with self._lock:
+            self._requests += 1
+        delay = self.hedge_delay(stage, policy)
+        if delay is None:
+            result, seconds = self._timed(fn)
+            self.observe(stage, seconds, policy["window"])
+            return result
+
+        pool = self._executor()
+        primary = pool.submit(self._timed, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._allow_hedge():
+            result, seconds = primary.result()
+            self.observe(stage, seconds, policy["window"])
+            return result
+
+        if on_hedge:
+            on_hedge("fired")
+        hedge = pool.submit(self._timed, fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (f for f in (primary, hedge) if f in done):
+                if future.exception() is None:
+                    result, seconds = future.result()
+                    self.observe(stage, seconds, policy["window"])
+                    if on_hedge:
+                        on_hedge("won" if future is hedge else "lost")
+                    loser = hedge if future is primary else primary
+                    loser.add_done_callback(lambda f: self._discard(f, stage, policy, on_discard))
+                    return result
+        raise primary.exception()
+
+    def _discard(self, future, stage: str, policy: dict, on_discard):
+        """Account for a losing request once it completes (the blocking SDK call cannot be cancelled)"""
+        if future.exception() is not None:
+            return
+        result, seconds = future.result()
+        self.observe(stage, seconds, policy["window"])
+        if on_discard:
+            self.add_extra_spend(on_discard(result) or 0.0)
+
+    async def acall(self, stage: str, coro_fn, on_discard=None, on_hedge=None):
+        """
+        Async variant of call: the losing request is cancelled instead of left to finish.
+
+        Args:
+            stage (str): Pipeline stage, for the latency statistics and policy
+            coro_fn (callable): Returns a new coroutine making one API request
+            on_discard (callable, optional): Called (in a worker thread) with the result of the losing
+                                             request, or None if it was cancelled before finishing;
+                                             returns its cost in USD (counted against max_extra_usd)
+            on_hedge (callable, optional): Called with "fired", then "won" or "lost" (hedge outcome)
+
+        Returns:
+            The result of the first request to succeed. If both fail, the primary's error is raised.
+        """
+        policy = get_hedge_policy(stage)
+        with self._lock:
+            self._requests += 1
+        delay = self.hedge_delay(stage, policy)
+
+        async def timed():
+            started = time.perf_counter()
+            result = await coro_fn()
+            return result, time.perf_counter() - started
+
+        if delay is None:
+            result, seconds = await timed()
+            self.observe(stage, seconds, policy["window"])
+            return result
+
+        primary = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done or not self._allow_hedge():
+            result, seconds = await primary
+            self.observe(stage, seconds, policy["window"])
+            return result
+
+        if on_hedge:
+            on_hedge("fired")
+        hedge = asyncio.ensure_future(timed())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (t for t in (primary, hedge) if t in done):
+                    if task.exception() is None:
+                        result, seconds = task.result()
+                        self.observe(stage, seconds, policy["window"])
+                        if on_hedge:
+                            on_hedge("won" if task is hedge else "lost")
+                        loser = hedge if task is primary else primary
+                        if loser.done():
+                            # Both finished together: the loser's result is simply not used
+                            if on_discard and not loser.cancelled() and loser.exception() is None:
+                                await self._adiscard(on_discard, loser.result()[0])
+                        else:
+                            pending.discard(loser)
+                            loser.cancel()
+                            if on_discard:
+                                await self._adiscard(on_discard, None)
+                        return result
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _adiscard(self, on_discard, result):
+        """Account for a losing async request (cancelled if result is None)"""
+        self.add_extra_spend(await asyncio.to_thread(on_discard, result) or 0.0)
+
+# Process-wide hedger used by call_llm
+hedger = Hedger()
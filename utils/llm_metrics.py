@@ -0,0 +1,289 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+
+# Histogram buckets (upper bounds), Prometheus style
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000)
+
+# Estimated USD price per million tokens: model -> (input, output). Unknown models cost 0.
+# Override or extend with LLM_PRICES='{"gemini-2.5-pro-exp-03-25": [1.25, 10.0]}'
+MODEL_PRICES = {
+    "gemini-2.5-pro-exp-03-25": (1.25, 10.0),
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+# Batch jobs (see utils/llm_batch.py) are billed at this fraction of the regular price
+BATCH_PRICE_FACTOR = float(os.getenv("LLM_BATCH_PRICE_FACTOR", "0.5"))
+
+# Where metrics are dumped at the end of a run (defaults to the LLM log directory)
+METRICS_DIR = os.getenv("LLM_METRICS_DIR", os.getenv("LOG_DIR", "logs"))
+
+# Raw latency samples kept per stage for exact percentiles
+MAX_SAMPLES = 10000
+
+def estimate_cost(model: str, prompt_tokens: int, response_tokens: int) -> float:
+    """Estimated USD cost of a call from the MODEL_PRICES table"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + response_tokens * output_price) / 1_000_000
+
+def percentile(samples, q: float):
+    """q-th percentile (0-100) of a list of numbers, nearest-rank; None for an empty list"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+class Histogram:
+    """Cumulative-bucket histogram with sum and count, as exported to Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)], ending with +Inf"""
+        total, result = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((math.inf, self.count))
+        return result
+
+    def to_dict(self) -> dict:
+        return {"buckets": {_format_bound(b): c for b, c in self.cumulative()}, "sum": self.sum, "count": self.count}
+
+def _format_bound(bound) -> str:
+    return "+Inf" if bound == math.inf else f"{bound:g}"
+
+def _labels(**labels) -> str:
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class LLMMetrics:
+    """
+    Per-call LLM telemetry, aggregated by calling node (stage), model and source.
+
+    Each call records its latency, prompt/response tokens, retries and estimated cost.
+    Sources are "api" (a billed request), "batch" (a request in a batch job), "cache",
+    "dedup" (shared another caller's request) and "replay". Tokens and cost are only
+    counted for API and batch calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far (e.g. between jobs in a reused worker)"""
+        with self._lock:
+            self.started_at = time.time()
+            self.calls = {}        # (stage, model, source) -> count
+            self.latency = {}      # (stage, model, source) -> Histogram
+            self.samples = {}      # stage -> [(seconds, source)]
+            self.tokens = {}       # (stage, model, direction) -> total tokens
+            self.token_hist = {}   # (stage, direction) -> Histogram
+            self.retries = {}      # stage -> count
+            self.cost = {}         # (stage, model) -> USD
+            self.hedges = {}       # (stage, outcome) -> count; outcome: fired, won (hedge first), lost
+            self.hedge_cost = {}   # (stage, model) -> USD spent on losing requests
+
+    def record(self, stage: str, model: str, source: str, seconds: float, prompt_tokens: int = 0,
+               response_tokens: int = 0, retries: int = 0):
+        """Record one completed call"""
+        stage = stage or "default"
+        key = (stage, model, source)
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            samples = self.samples.setdefault(stage, [])
+            if len(samples) < MAX_SAMPLES:
+                samples.append((seconds, source))
+            if retries:
+                self.retries[stage] = self.retries.get(stage, 0) + retries
+            if source in ("api", "batch"):
+                for direction, count in (("prompt", prompt_tokens), ("response", response_tokens)):
+                    self.tokens[(stage, model, direction)] = self.tokens.get((stage, model, direction), 0) + count
+                    self.token_hist.setdefault((stage, direction), Histogram(TOKEN_BUCKETS)).observe(count)
+                cost = estimate_cost(model, prompt_tokens, response_tokens)
+                if source == "batch":
+                    cost *= BATCH_PRICE_FACTOR
+                self.cost[(stage, model)] = self.cost.get((stage, model), 0.0) + cost
+
+    def record_hedge(self, stage: str, outcome: str):
+        """Count a hedged request: "fired", then "won" if the hedge finished first or "lost" if the primary did"""
+        key = (stage or "default", outcome)
+        with self._lock:
+            self.hedges[key] = self.hedges.get(key, 0) + 1
+
+    def record_hedge_spend(self, stage: str, model: str, prompt_tokens: int, response_tokens: int) -> float:
+        """Account for the tokens of a losing hedged request. Returns its estimated cost in USD."""
+        stage = stage or "default"
+        usd = estimate_cost(model, prompt_tokens, response_tokens)
+        with self._lock:
+            for direction, count in (("prompt", prompt_tokens), ("response", response_tokens)):
+                self.tokens[(stage, model, direction)] = self.tokens.get((stage, model, direction), 0) + count
+            self.cost[(stage, model)] = self.cost.get((stage, model), 0.0) + usd
+            self.hedge_cost[(stage, model)] = self.hedge_cost.get((stage, model), 0.0) + usd
+        return usd
+
+    def stage_summary(self) -> dict:
+        """Per stage: call counts by source, p50/p95 latency of API calls and overall, tokens, retries, cost"""
+        with self._lock:
+            summary = {}
+            for stage, samples in self.samples.items():
+                api_times = [seconds for seconds, source in samples if source == "api"]
+                all_times = [seconds for seconds, _ in samples]
+                sources = {}
+                for (s, _, source), count in self.calls.items():
+                    if s == stage:
+                        sources[source] = sources.get(source, 0) + count
+                summary[stage] = {
+                    "calls": sum(sources.values()),
+                    "sources": sources,
+                    "models": sorted({model for (s, model, _) in self.calls if s == stage}),
+                    "api_seconds_total": sum(api_times),
+                    "api_p50": percentile(api_times, 50),
+                    "api_p95": percentile(api_times, 95),
+                    "p50": percentile(all_times, 50),
+                    "p95": percentile(all_times, 95),
+                    "prompt_tokens": sum(v for (s, _, d), v in self.tokens.items() if s == stage and d == "prompt"),
+                    "response_tokens": sum(v for (s, _, d), v in self.tokens.items() if s == stage and d == "response"),
+                    "retries": self.retries.get(stage, 0),
+                    "cost_usd": sum(v for (s, _), v in self.cost.items() if s == stage),
+                    "hedges_fired": self.hedges.get((stage, "fired"), 0),
+                    "hedges_won": self.hedges.get((stage, "won"), 0),
+                    "hedge_cost_usd": sum(v for (s, _), v in self.hedge_cost.items() if s == stage),
+                }
+            return summary
+
+    def to_dict(self) -> dict:
+        """Everything recorded, as JSON-serializable data"""
+        stages = self.stage_summary()
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "finished_at": time.time(),
+                "stages": stages,
+                "calls": [{"stage": s, "model": m, "source": src, "count": c} for (s, m, src), c in self.calls.items()],
+                "latency_seconds": [
+                    {"stage": s, "model": m, "source": src, **h.to_dict()} for (s, m, src), h in self.latency.items()
+                ],
+                "tokens": [
+                    {"stage": s, "direction": d, **h.to_dict()} for (s, d), h in self.token_hist.items()
+                ],
+                "cost_usd_total": sum(self.cost.values()),
+            }
+
+    def to_prometheus(self, prefix: str = "llm") -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += [f"# HELP {prefix}_calls_total LLM calls by stage, model and source (api, cache, dedup, replay).",
+                      f"# TYPE {prefix}_calls_total counter"]
+            for (stage, model, source), count in sorted(self.calls.items()):
+                lines.append(f"{prefix}_calls_total{_labels(stage=stage, model=model, source=source)} {count}")
+
+            lines += [f"# HELP {prefix}_call_duration_seconds LLM call latency.",
+                      f"# TYPE {prefix}_call_duration_seconds histogram"]
+            for (stage, model, source), hist in sorted(self.latency.items()):
+                for bound, count in hist.cumulative():
+                    labels = _labels(stage=stage, model=model, source=source, le=_format_bound(bound))
+                    lines.append(f"{prefix}_call_duration_seconds_bucket{labels} {count}")
+                labels = _labels(stage=stage, model=model, source=source)
+                lines.append(f"{prefix}_call_duration_seconds_sum{labels} {hist.sum:.6f}")
+                lines.append(f"{prefix}_call_duration_seconds_count{labels} {hist.count}")
+
+            lines += [f"# HELP {prefix}_tokens_total Tokens sent and received by API calls.",
+                      f"# TYPE {prefix}_tokens_total counter"]
+            for (stage, model, direction), count in sorted(self.tokens.items()):
+                lines.append(f"{prefix}_tokens_total{_labels(stage=stage, model=model, direction=direction)} {count}")
+
+            lines += [f"# HELP {prefix}_call_tokens Tokens per API call.",
+                      f"# TYPE {prefix}_call_tokens histogram"]
+            for (stage, direction), hist in sorted(self.token_hist.items()):
+                for bound, count in hist.cumulative():
+                    lines.append(f"{prefix}_call_tokens_bucket{_labels(stage=stage, direction=direction, le=_format_bound(bound))} {count}")
+                lines.append(f"{prefix}_call_tokens_sum{_labels(stage=stage, direction=direction)} {hist.sum:.0f}")
+                lines.append(f"{prefix}_call_tokens_count{_labels(stage=stage, direction=direction)} {hist.count}")
+
+            lines += [f"# HELP {prefix}_retries_total Retried API requests.",
+                      f"# TYPE {prefix}_retries_total counter"]
+            for stage, count in sorted(self.retries.items()):
+                lines.append(f"{prefix}_retries_total{_labels(stage=stage)} {count}")
+
+            lines += [f"# HELP {prefix}_hedges_total Hedged requests (fired; won = hedge finished first, lost = primary did).",
+                      f"# TYPE {prefix}_hedges_total counter"]
+            for (stage, outcome), count in sorted(self.hedges.items()):
+                lines.append(f"{prefix}_hedges_total{_labels(stage=stage, outcome=outcome)} {count}")
+
+            lines += [f"# HELP {prefix}_hedge_cost_usd_total Estimated cost of losing hedged requests in USD.",
+                      f"# TYPE {prefix}_hedge_cost_usd_total counter"]
+            for (stage, model), cost in sorted(self.hedge_cost.items()):
+                lines.append(f"{prefix}_hedge_cost_usd_total{_labels(stage=stage, model=model)} {cost:.6f}")
+
+            lines += [f"# HELP {prefix}_cost_usd_total Estimated cost of API calls in USD.",
+                      f"# TYPE {prefix}_cost_usd_total counter"]
+            for (stage, model), cost in sorted(self.cost.items()):
+                lines.append(f"{prefix}_cost_usd_total{_labels(stage=stage, model=model)} {cost:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def format_report(self) -> str:
+        """Human-readable per-stage summary"""
+        lines = ["LLM calls by stage:"]
+        for stage, s in self.stage_summary().items():
+            cached = s["calls"] - s["sources"].get("api", 0) - s["sources"].get("batch", 0)
+            p50 = f"{s['api_p50']:.1f}s" if s["api_p50"] is not None else "-"
+            p95 = f"{s['api_p95']:.1f}s" if s["api_p95"] is not None else "-"
+            lines.append(
+                f"  {stage:22s} {s['calls']:3d} calls ({cached} cached) | total {s['api_seconds_total']:7.1f}s | "
+                f"p50 {p50:>6s} | p95 {p95:>6s} | tokens {s['prompt_tokens']}/{s['response_tokens']} | "
+                f"retries {s['retries']} | ${s['cost_usd']:.4f} | {', '.join(s['models'])}"
+            )
+            if s["hedges_fired"]:
+                lines.append(f"  {'':22s} hedged {s['hedges_fired']} calls, hedge won {s['hedges_won']} | "
+                             f"extra spend ${s['hedge_cost_usd']:.4f}")
+        return "\n".join(lines)
+
+    def write(self, directory: str = None, name: str = "run") -> tuple:
+        """
+        Dump the metrics as JSON (llm_metrics_<name>_<timestamp>.json, one file per run)
+        and Prometheus text (llm_metrics.prom, overwritten, for a textfile collector).
+
+        Returns:
+            tuple: (json path, prometheus path)
+        """
+        directory = directory or METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        json_path = os.path.join(directory, f"llm_metrics_{name}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        prom_path = os.path.join(directory, "llm_metrics.prom")
+        with open(prom_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(prom_path + ".tmp", prom_path)  # Scrapers never see a partial file
+        return json_path, prom_path
+
+# Process-wide metrics recorded by call_llm
+metrics = LLMMetrics()
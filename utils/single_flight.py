@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import weakref
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the work; callers arriving while
+    it is in flight wait and receive the leader's result, or its exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def begin(self, key):
+        """Register interest in a key. Returns (call, is_leader); the leader must call finish()."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """Publish the leader's result (or error) to waiting callers"""
+        call.result, call.error = result, error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call):
+        """Wait for the leader and return its result (re-raising its error)"""
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers of key. Returns (result, shared)."""
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: callers on the same event loop share one task per key"""
+
+    def __init__(self):
+        self._tasks = weakref.WeakKeyDictionary()  # event loop -> {key: task}
+
+    async def do(self, key, coro_fn):
+        """Await coro_fn() once for all concurrent callers of key. Returns (result, shared)."""
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is not None:
+            # Shield so a cancelled waiter does not cancel the shared call
+            return await asyncio.shield(task), True
+
+        task = loop.create_task(coro_fn())
+        tasks[key] = task
+        task.add_done_callback(lambda _: tasks.pop(key, None))
+        return await asyncio.shield(task), False